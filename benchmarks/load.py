@@ -0,0 +1,475 @@
+import argparse
+import asyncio
+import json
+import platform
+import resource
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from http import HTTPStatus
+from itertools import count
+from pathlib import Path
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import make_url
+
+from benchmarks.seed import (
+    BENCHMARK_PASSWORD,
+    seed,
+    seeded_todos,
+    seeded_users,
+)
+from fastapi_async import database
+from fastapi_async.app import app
+from fastapi_async.database import build_engine, replica_router
+from fastapi_async.pagination import encode_cursor
+from fastapi_async.ratelimit import login_rate_limiter
+from fastapi_async.security import principal_cache
+from fastapi_async.settings import Settings
+
+PERCENTILES = {'p50': 50, 'p95': 95, 'p99': 99}
+PAGE_SIZE = 10
+BULK_SIZE = 100
+IMPORT_ROWS = 1000
+SEARCH_TERM = 'Title 42'
+# Authenticated requests whose cost should not grow with the todo count.
+SWEEP_ROUTES = ('refresh_token', 'list')
+NO_TODOS = (range(0), None)
+POSTGRES_PORT = 5432
+REPORTED_SETTINGS = (
+    'DATABASE_POOL_SIZE',
+    'DATABASE_MAX_OVERFLOW',
+    'DATABASE_PREPARE_THRESHOLD',
+    'DATABASE_NULL_POOL',
+    'FAST_JSON_RESPONSES',
+    'PASSWORD_HASH_WORKERS',
+)
+
+
+@dataclass
+class BenchmarkUser:
+    id: int
+    username: str
+    todo_ids: range
+    created_at: datetime
+    token: str = ''
+    etag: str = ''
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {'Authorization': f'Bearer {self.token}'}
+
+
+@dataclass
+class RouteResult:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    response_bytes: int = 0
+
+
+def _login(user, sequence):
+    return (
+        'post',
+        '/auth/token',
+        {'data': {'username': user.username, 'password': BENCHMARK_PASSWORD}},
+    )
+
+
+def _refresh_token(user, sequence):
+    return 'post', '/auth/refresh-token', {'headers': user.headers}
+
+
+def _list(user, sequence):
+    return 'get', f'/todos/?limit={PAGE_SIZE}', {'headers': user.headers}
+
+
+def _list_not_modified(user, sequence):
+    return (
+        'get',
+        f'/todos/?limit={PAGE_SIZE}',
+        {'headers': {**user.headers, 'If-None-Match': user.etag}},
+    )
+
+
+def _list_deep_offset(user, sequence):
+    offset = len(user.todo_ids) - PAGE_SIZE
+    return (
+        'get',
+        f'/todos/?limit={PAGE_SIZE}&offset={offset}',
+        {'headers': user.headers},
+    )
+
+
+def _list_deep_cursor(user, sequence):
+    cursor = encode_cursor(user.created_at, user.todo_ids[-PAGE_SIZE - 1])
+    return (
+        'get',
+        '/todos/',
+        {
+            'params': {'limit': PAGE_SIZE, 'cursor': cursor},
+            'headers': user.headers,
+        },
+    )
+
+
+def _search(user, sequence):
+    return (
+        'get',
+        '/todos/',
+        {
+            'params': {'title': SEARCH_TERM, 'rank': True},
+            'headers': user.headers,
+        },
+    )
+
+
+def _export(user, sequence):
+    return 'get', '/todos/export', {'headers': user.headers}
+
+
+def _create(user, sequence):
+    return (
+        'post',
+        '/todos/',
+        {'json': {'title': 'Benchmark todo'}, 'headers': user.headers},
+    )
+
+
+def _create_bulk(user, sequence):
+    return (
+        'post',
+        '/todos/bulk',
+        {
+            'json': {'todos': [{'title': 'Benchmark todo'}] * BULK_SIZE},
+            'headers': user.headers,
+        },
+    )
+
+
+def _import(user, sequence):
+    rows = json.dumps({'title': 'Imported todo'}) + '\n'
+    return (
+        'post',
+        '/todos/import',
+        {'content': rows * IMPORT_ROWS, 'headers': user.headers},
+    )
+
+
+def _patch(user, sequence):
+    todo_id = user.todo_ids[sequence % len(user.todo_ids)]
+    return (
+        'patch',
+        f'/todos/{todo_id}',
+        {'json': {'state': 'done'}, 'headers': user.headers},
+    )
+
+
+def _delete(user, sequence):
+    todo_id = user.todo_ids[-1 - sequence]
+    return 'delete', f'/todos/{todo_id}', {'headers': user.headers}
+
+
+# Reads run before writes so every read sees the seeded data set.
+SCENARIOS = {
+    'login': _login,
+    'refresh_token': _refresh_token,
+    'list': _list,
+    'list_not_modified': _list_not_modified,
+    'list_deep_offset': _list_deep_offset,
+    'list_deep_cursor': _list_deep_cursor,
+    'search': _search,
+    'export': _export,
+    'create': _create,
+    'create_bulk': _create_bulk,
+    'import': _import,
+    'patch': _patch,
+    'delete': _delete,
+}
+
+
+def _percentile(values: list[float], percentile: int) -> float:
+    ordered = sorted(values)
+    index = round(percentile / 100 * (len(ordered) - 1))
+
+    return ordered[index]
+
+
+async def _database_queries(client) -> float:
+    exposition = (await client.get('/metrics')).text
+    total = 0.0
+
+    for line in exposition.splitlines():
+        series, _, value = line.rpartition(' ')
+        name, _, labels = series.partition('{')
+
+        if name == 'db_queries_per_request_sum' and (
+            'route="/metrics"' not in labels
+        ):
+            total += float(value)
+
+    return total
+
+
+async def _run_route(client, users, scenario, options) -> RouteResult:
+    result = RouteResult()
+    requests = count()
+
+    async def worker():
+        while (index := next(requests)) < options.requests:
+            # `sequence` counts this user's requests, so writes that need a
+            # fresh todo id never collide with another worker.
+            sequence, position = divmod(index, len(users))
+            method, url, kwargs = scenario(users[position], sequence)
+
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            result.latencies.append(time.perf_counter() - start)
+            result.response_bytes += len(response.content)
+
+            if response.status_code >= HTTPStatus.BAD_REQUEST:
+                result.errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(options.concurrency)))
+
+    return result
+
+
+def _summary(
+    result: RouteResult, seconds: float, cpu_seconds: float, queries: float
+) -> dict:
+    latencies_ms = [latency * 1000 for latency in result.latencies]
+
+    return {
+        'requests': len(latencies_ms),
+        'errors': result.errors,
+        'seconds': round(seconds, 3),
+        'throughput_rps': round(len(latencies_ms) / seconds, 1),
+        'latency_ms': {
+            'mean': round(statistics.fmean(latencies_ms), 2),
+            **{
+                name: round(_percentile(latencies_ms, percentile), 2)
+                for name, percentile in PERCENTILES.items()
+            },
+            'max': round(max(latencies_ms), 2),
+        },
+        # The client runs in-process through ASGITransport, so this
+        # includes its share of the work; compare runs, not absolutes.
+        'cpu_ms_per_request': round(cpu_seconds * 1000 / len(latencies_ms), 3),
+        'queries_per_request': round(queries / len(latencies_ms), 2),
+        'response_bytes_per_request': round(
+            result.response_bytes / len(latencies_ms)
+        ),
+    }
+
+
+async def _login_users(client, users: list[BenchmarkUser]):
+    for user in users:
+        response = await client.post(
+            '/auth/token',
+            data={'username': user.username, 'password': BENCHMARK_PASSWORD},
+        )
+        user.token = response.json()['access_token']
+
+        response = await client.get(
+            f'/todos/?limit={PAGE_SIZE}', headers=user.headers
+        )
+        user.etag = response.headers['etag']
+
+
+async def _benchmark_users(seeded) -> list[BenchmarkUser]:
+    todos = await seeded_todos(replica_router.primary)
+
+    return [
+        BenchmarkUser(user_id, username, *todos.get(user_id, NO_TODOS))
+        for user_id, username in seeded
+    ]
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def _measure(client, users, name: str, options) -> dict:
+    queries_before = await _database_queries(client)
+    rss_before = _peak_rss_mb()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = await _run_route(client, users, SCENARIOS[name], options)
+    cpu_seconds = time.process_time() - cpu_start
+    seconds = time.perf_counter() - start
+    queries = await _database_queries(client) - queries_before
+    peak_rss = _peak_rss_mb()
+
+    return {
+        **_summary(result, seconds, cpu_seconds, queries),
+        'peak_rss_mb': round(peak_rss, 1),
+        'peak_rss_growth_mb': round(peak_rss - rss_before, 1),
+    }
+
+
+async def _todo_count_sweep(client, options) -> dict:
+    # Per-request cost against the size of one user's todo list; every
+    # step re-seeds the database with that single user.
+    results = {}
+
+    for todos in options.sweep_todos:
+        seeded = await seed(replica_router.primary, 1, todos)
+        users = await _benchmark_users(seeded)
+        principal_cache.clear()
+        await _login_users(client, users)
+
+        results[todos] = {
+            name: await _measure(client, users, name, options)
+            for name in options.sweep_routes
+        }
+
+    return results
+
+
+def _database(url: str) -> tuple:
+    url = make_url(url)
+    return url.host, url.port or POSTGRES_PORT, url.database
+
+
+def _is_app_database(url: str) -> bool:
+    settings = Settings()
+    app_urls = [settings.DATABASE_URL, *settings.DATABASE_REPLICA_URLS]
+
+    return _database(url) in [_database(app_url) for app_url in app_urls]
+
+
+def _use_database(settings: Settings, url: str):
+    # The app and the seeding share one engine on the benchmark database;
+    # the configured replicas belong to the app database, so none are used.
+    engine = build_engine(settings.model_copy(update={'DATABASE_URL': url}))
+    database._engine = engine
+    replica_router.primary = engine
+    replica_router.replicas = []
+
+    return engine
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(options) -> dict:
+    settings = Settings()
+    report = {
+        'meta': {
+            'commit': _commit(),
+            'started_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'users': options.users,
+            'todos_per_user': options.todos_per_user,
+            'concurrency': options.concurrency,
+            'requests_per_route': options.requests,
+            'login_rate_limit': options.login_rate_limit,
+            'settings': {
+                name: getattr(settings, name) for name in REPORTED_SETTINGS
+            },
+        },
+        'routes': {},
+    }
+
+    # Every benchmark request comes from one client address, so the login
+    # limiter would turn the login scenario into a run of 429s.
+    login_rate_limiter.enabled = options.login_rate_limit
+    engine = _use_database(settings, options.database_url)
+
+    if options.skip_seed:
+        seeded = await seeded_users(engine, options.users)
+    else:
+        seeded = await seed(engine, options.users, options.todos_per_user)
+
+    users = await _benchmark_users(seeded)
+    transport = ASGITransport(app=app)
+
+    async with AsyncClient(transport=transport, base_url='http://bench') as (
+        client
+    ):
+        await _login_users(client, users)
+
+        for name in options.routes:
+            report['routes'][name] = await _measure(
+                client, users, name, options
+            )
+
+        if options.sweep_todos:
+            report['todo_count_sweep'] = await _todo_count_sweep(
+                client, options
+            )
+
+    await replica_router.primary.dispose()
+
+    return report
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description='Drive every route of the app under concurrent load.'
+    )
+    parser.add_argument(
+        '--database-url',
+        required=True,
+        help='database to benchmark against; it is wiped and re-migrated '
+        'unless --skip-seed is given, so it must not be the app database',
+    )
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--todos-per-user', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument(
+        '--routes', nargs='*', choices=SCENARIOS, default=list(SCENARIOS)
+    )
+    parser.add_argument(
+        '--sweep-todos',
+        type=int,
+        nargs='*',
+        default=[],
+        help='after the routes, re-seed one user with each todo count and '
+        'run --sweep-routes against it',
+    )
+    parser.add_argument(
+        '--sweep-routes',
+        nargs='+',
+        choices=SCENARIOS,
+        default=list(SWEEP_ROUTES),
+    )
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument(
+        '--login-rate-limit',
+        action='store_true',
+        help='keep the login rate limiter on (it is off by default)',
+    )
+    parser.add_argument('--output', type=Path)
+    options = parser.parse_args(argv)
+
+    seeds = not options.skip_seed or options.sweep_todos
+    if seeds and _is_app_database(options.database_url):
+        parser.error(
+            'refusing to reset the app database; pass a separate '
+            '--database-url'
+        )
+
+    if options.requests > options.users * options.todos_per_user:
+        parser.error('--requests must not exceed the seeded todos')
+
+    report = json.dumps(asyncio.run(run(options)), indent=2)
+
+    if options.output:
+        options.output.write_text(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
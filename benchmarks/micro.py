@@ -0,0 +1,213 @@
+import argparse
+import asyncio
+import json
+import time
+import timeit
+from pathlib import Path
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from benchmarks.seed import seeded_users
+from fastapi_async.compression import COMPRESSORS
+from fastapi_async.database import replica_router
+from fastapi_async.models import Todo, TodoState, User
+from fastapi_async.schemas import (
+    TodoListSchema,
+    TodoOutSchema,
+    UserListSchema,
+    UserOutSchema,
+)
+
+ENCODING_LEVELS = {
+    'gzip': (1, 6, 9),
+    'br': (1, 4, 11),
+    'zstd': (1, 3, 19),
+}
+
+
+def _todo(todo_id: int) -> Todo:
+    todo = Todo(
+        title=f'Todo Title {todo_id}',
+        description='Dog pattern technology most nothing.',
+        state=TodoState.TODO,
+        user_id=1,
+    )
+    todo.id = todo_id
+
+    return todo
+
+
+def _user(user_id: int) -> User:
+    user = User(
+        username=f'user{user_id}',
+        email=f'user{user_id}@email.com',
+        password='hashed',
+    )
+    user.id = user_id
+
+    return user
+
+
+def _payloads(items: int) -> dict:
+    todos = [_todo(todo_id) for todo_id in range(items)]
+    users = [_user(user_id) for user_id in range(items)]
+
+    return {
+        'TodoOutSchema': (TodoOutSchema, todos[0]),
+        'UserOutSchema': (UserOutSchema, users[0]),
+        'TodoListSchema': (
+            TodoListSchema,
+            {'todos': todos, 'next_cursor': 'cursor'},
+        ),
+        'UserListSchema': (
+            UserListSchema,
+            {'users': users, 'next_cursor': 'cursor'},
+        ),
+    }
+
+
+def _per_call_us(function, number: int) -> float:
+    return round(timeit.timeit(function, number=number) / number * 1e6, 1)
+
+
+def serialization(items: int, number: int) -> dict:
+    loop = asyncio.new_event_loop()
+    results = {}
+
+    for name, (schema, content) in _payloads(items).items():
+        response_field = create_model_field(
+            name='response', type_=schema, mode='serialization'
+        )
+        adapter = TypeAdapter(schema)
+
+        def default(response_field=response_field, content=content):
+            serialized = loop.run_until_complete(
+                serialize_response(
+                    field=response_field, response_content=content
+                )
+            )
+            return JSONResponse(serialized).body
+
+        def fast(adapter=adapter, content=content):
+            return adapter.dump_json(
+                adapter.validate_python(content, from_attributes=True)
+            )
+
+        results[name] = {
+            'default_us': _per_call_us(default, number),
+            'fast_json_us': _per_call_us(fast, number),
+        }
+
+    loop.close()
+
+    return results
+
+
+def compression(items: int, number: int) -> dict:
+    _, content = _payloads(items)['TodoListSchema']
+    body = TypeAdapter(TodoListSchema).dump_json(
+        TodoListSchema.model_validate(content, from_attributes=True)
+    )
+    results = {'identity_bytes': len(body)}
+
+    for encoding, levels in ENCODING_LEVELS.items():
+        if encoding not in COMPRESSORS:
+            continue
+
+        for level in levels:
+            compressed = COMPRESSORS[encoding](level)(body, True)
+            results[f'{encoding}-{level}'] = {
+                'bytes': len(compressed),
+                'us': _per_call_us(
+                    lambda encoding=encoding, level=level: COMPRESSORS[
+                        encoding
+                    ](level)(body, True),
+                    number,
+                ),
+            }
+
+    return results
+
+
+async def _time_queries(connection, queries, number: int) -> float:
+    start = time.perf_counter()
+
+    for index in range(number):
+        await connection.execute(queries[index % len(queries)])
+
+    return round((time.perf_counter() - start) / number * 1e6, 1)
+
+
+async def principal_lookup(users: int, number: int) -> dict:
+    # get_current_user before and after user-004: the username/email OR
+    # lookup from `sub` against the primary key lookup from `uid`.
+    columns = (User.id, User.username, User.token_version)
+    engine = replica_router.primary
+    seeded = await seeded_users(engine, users)
+
+    by_name = [
+        select(*columns).where(
+            (User.username == username) | (User.email == username)
+        )
+        for _, username in seeded
+    ]
+    by_id = [
+        select(*columns).where(User.id == user_id) for user_id, _ in seeded
+    ]
+
+    async with engine.connect() as connection:
+        # Warm the pool connection and the statement caches first.
+        await _time_queries(connection, by_name + by_id, len(seeded) * 2)
+
+        results = {
+            'username_or_email_us': await _time_queries(
+                connection, by_name, number
+            ),
+            'primary_key_us': await _time_queries(connection, by_id, number),
+        }
+
+    await engine.dispose()
+
+    return results
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description='Serialization and compression micro-benchmarks.'
+    )
+    parser.add_argument('--items', type=int, default=100)
+    parser.add_argument('--number', type=int, default=1000)
+    parser.add_argument(
+        '--lookup-users',
+        type=int,
+        default=0,
+        help='time principal lookups against this many seeded users',
+    )
+    parser.add_argument('--output', type=Path)
+    options = parser.parse_args(argv)
+
+    report = {
+        'items': options.items,
+        'serialization': serialization(options.items, options.number),
+        'compression': compression(options.items, options.number),
+    }
+
+    if options.lookup_users:
+        report['principal_lookup'] = asyncio.run(
+            principal_lookup(options.lookup_users, options.number)
+        )
+
+    report = json.dumps(report, indent=2)
+
+    if options.output:
+        options.output.write_text(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+from sqlalchemy import func, select, text
+
+from fastapi_async.models import Todo, User
+from fastapi_async.security import get_hashed_password
+from tests.conftest import TodoFactory, UserFactory
+
+BENCHMARK_PASSWORD = 'benchmarkpassword'
+COPY_USERS = 'COPY users (username, email, password) FROM STDIN'
+COPY_TODOS = 'COPY todos (title, description, state, user_id) FROM STDIN'
+PROJECT_ROOT = Path(__file__).parent.parent
+
+
+async def _copy(connection, statement: str, rows):
+    raw_connection = await connection.get_raw_connection()
+
+    async with raw_connection.driver_connection.cursor() as cursor:
+        async with cursor.copy(statement) as copy:
+            for row in rows:
+                await copy.write_row(row)
+
+
+async def reset_schema(engine):
+    # Built by the migrations rather than the models, so the database has
+    # the same migration-only objects and alembic stamp as production.
+    async with engine.begin() as connection:
+        await connection.execute(text('DROP SCHEMA public CASCADE'))
+        await connection.execute(text('CREATE SCHEMA public'))
+
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        '-m',
+        'alembic',
+        'upgrade',
+        'head',
+        cwd=PROJECT_ROOT,
+        env={
+            **os.environ,
+            'DATABASE_URL': engine.url.render_as_string(hide_password=False),
+        },
+        # Keeps alembic's output out of the report on stdout.
+        stdout=sys.stderr,
+    )
+
+    if await process.wait():
+        raise RuntimeError('alembic upgrade head failed')
+
+
+def _todo_rows(user_ids: list[int], todos_per_user: int):
+    for user_id in user_ids:
+        for todo in TodoFactory.build_batch(todos_per_user, user_id=user_id):
+            yield todo.title, todo.description, todo.state.name, user_id
+
+
+async def seed(
+    engine, users: int, todos_per_user: int
+) -> list[tuple[int, str]]:
+    # Hashing once keeps seeding fast; every user shares the password.
+    hashed_password = get_hashed_password(BENCHMARK_PASSWORD)
+
+    await reset_schema(engine)
+
+    async with engine.begin() as connection:
+        await _copy(
+            connection,
+            COPY_USERS,
+            (
+                (user.username, user.email, hashed_password)
+                for user in UserFactory.build_batch(users)
+            ),
+        )
+        seeded = (
+            await connection.execute(
+                select(User.id, User.username).order_by(User.id)
+            )
+        ).all()
+
+        await _copy(
+            connection,
+            COPY_TODOS,
+            _todo_rows([user_id for user_id, _ in seeded], todos_per_user),
+        )
+
+    async with engine.connect() as connection:
+        await connection.execution_options(isolation_level='AUTOCOMMIT')
+        await connection.execute(text('VACUUM ANALYZE'))
+
+    return seeded
+
+
+async def seeded_users(engine, limit: int) -> list[tuple[int, str]]:
+    async with engine.connect() as connection:
+        rows = await connection.execute(
+            select(User.id, User.username).order_by(User.id).limit(limit)
+        )
+
+        return rows.all()
+
+
+async def seeded_todos(engine) -> dict[int, tuple[range, object]]:
+    async with engine.connect() as connection:
+        rows = await connection.execute(
+            select(
+                Todo.user_id,
+                func.min(Todo.id),
+                func.max(Todo.id),
+                func.max(Todo.created_at),
+            ).group_by(Todo.user_id)
+        )
+
+        return {
+            user_id: (range(first, last + 1), created_at)
+            for user_id, first, last, created_at in rows
+        }
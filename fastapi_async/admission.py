@@ -0,0 +1,206 @@
+import asyncio
+import time
+from collections import deque
+from http import HTTPStatus
+
+from fastapi.responses import JSONResponse
+
+from fastapi_async.metrics import (
+    ADMISSION_LIMIT,
+    ADMISSION_QUEUED,
+    ADMISSION_QUEUED_TOTAL,
+    ADMISSION_REJECTED,
+    register_collector,
+)
+from fastapi_async.settings import Settings
+
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+EXEMPT_PATHS = frozenset({'/metrics'})
+AIMD_DECREASE = 0.9
+
+
+def route_class(scope) -> str | None:
+    path = scope['path']
+
+    if path in EXEMPT_PATHS:
+        return None
+
+    if path.startswith('/auth/'):
+        return 'auth'
+
+    return 'reads' if scope['method'] in READ_METHODS else 'writes'
+
+
+class ConcurrencyLimiter:
+    def __init__(
+        self,
+        limit: int,
+        max_queue: int,
+        queue_timeout: float,
+        target_latency: float | None = None,
+    ):
+        self.max_limit = limit
+        self.limit = limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.active = 0
+        self._waiters = deque()
+        self._fast_responses = 0
+        self._decreased_at = 0.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def try_acquire(self) -> bool:
+        if self._waiters or self.active >= self.limit:
+            return False
+
+        self.active += 1
+        return True
+
+    async def wait(self) -> bool:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except TimeoutError:
+            self._abandon(waiter)
+            return False
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+        return True
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def observe(self, seconds: float):
+        if self.target_latency is None:
+            return
+
+        # AIMD: shrink by a factor on slow responses, at most once per
+        # target interval, and grow by one after a full window of fast ones.
+        if seconds > self.target_latency:
+            now = time.monotonic()
+            if now - self._decreased_at >= self.target_latency:
+                self.limit = max(1, int(self.limit * AIMD_DECREASE))
+                self._decreased_at = now
+            self._fast_responses = 0
+            return
+
+        self._fast_responses += 1
+        if self._fast_responses >= self.limit and (
+            self.limit < self.max_limit
+        ):
+            self.limit += 1
+            self._fast_responses = 0
+            self._wake()
+
+    def _wake(self):
+        while self._waiters and self.active < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.active += 1
+                waiter.set_result(None)
+
+    def _abandon(self, waiter):
+        # The slot may have been handed over just as the wait gave up.
+        if waiter.done() and not waiter.cancelled():
+            self.release()
+            return
+
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+def build_limiters(settings: Settings) -> dict[str, ConcurrencyLimiter]:
+    target_latency = (
+        settings.ADMISSION_TARGET_LATENCY_MS / 1000
+        if settings.ADMISSION_TARGET_LATENCY_MS is not None
+        else None
+    )
+
+    return {
+        name: ConcurrencyLimiter(
+            limit,
+            settings.ADMISSION_MAX_QUEUE,
+            settings.ADMISSION_QUEUE_TIMEOUT,
+            target_latency,
+        )
+        for name, limit in settings.ADMISSION_LIMITS.items()
+    }
+
+
+async def _admit(name: str, limiter: ConcurrencyLimiter) -> bool:
+    if limiter.try_acquire():
+        return True
+
+    if limiter.queued >= limiter.max_queue:
+        ADMISSION_REJECTED.inc(name, 'queue_full')
+        return False
+
+    ADMISSION_QUEUED_TOTAL.inc(name)
+
+    if await limiter.wait():
+        return True
+
+    ADMISSION_REJECTED.inc(name, 'queue_timeout')
+    return False
+
+
+class AdmissionMiddleware:
+    def __init__(
+        self,
+        app,
+        limiters: dict[str, ConcurrencyLimiter],
+        retry_after: int,
+    ):
+        self.app = app
+        self.limiters = limiters
+        self.retry_after = retry_after
+        register_collector(self._collect)
+
+    async def __call__(self, scope, receive, send):
+        name = route_class(scope) if scope['type'] == 'http' else None
+        limiter = self.limiters.get(name)
+
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if not await _admit(name, limiter):
+            await self._reject(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+
+        async def send_timed(message):
+            # Latency to the first byte, so long streams don't look slow.
+            if message['type'] == 'http.response.start':
+                limiter.observe(time.perf_counter() - start)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            limiter.release()
+
+    async def _reject(self, scope, receive, send):
+        response = JSONResponse(
+            {'detail': 'Server is busy, try again later'},
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            headers={'Retry-After': str(self.retry_after)},
+        )
+        await response(scope, receive, send)
+
+    def _collect(self):
+        for name, limiter in self.limiters.items():
+            ADMISSION_LIMIT.set(limiter.limit, name)
+            ADMISSION_QUEUED.set(limiter.queued, name)
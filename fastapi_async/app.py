@@ -1,10 +1,43 @@
-from fastapi import FastAPI
+from http import HTTPStatus
 
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from sqlalchemy.exc import OperationalError
+
+from fastapi_async import metrics
+from fastapi_async.admission import AdmissionMiddleware, build_limiters
+from fastapi_async.compression import CompressionMiddleware
+from fastapi_async.deadlines import (
+    CancelOnDisconnectMiddleware,
+    is_query_canceled,
+)
 from fastapi_async.routes import auth, todos, users
 from fastapi_async.schemas import Message
+from fastapi_async.settings import Settings
+
+settings = Settings()
 
 app = FastAPI()
 
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MINIMUM_SIZE,
+    encodings=settings.COMPRESSION_ENCODINGS,
+    levels=settings.COMPRESSION_LEVELS,
+)
+app.add_middleware(
+    AdmissionMiddleware,
+    limiters=build_limiters(settings),
+    retry_after=settings.ADMISSION_RETRY_AFTER_SECONDS,
+)
+# Outside admission, so the deadline clock includes time spent queued and a
+# client that gives up while queued frees its place.
+app.add_middleware(CancelOnDisconnectMiddleware)
+app.add_middleware(
+    metrics.MetricsMiddleware,
+    query_budget=settings.DATABASE_QUERY_BUDGET,
+)
+
 app.include_router(auth.router)
 app.include_router(users.router)
 app.include_router(todos.router)
@@ -13,3 +46,19 @@ app.include_router(todos.router)
 @app.get('/', response_model=Message)
 def read_root():
     return Message(message='Hello, World!')
+
+
+@app.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.exception_handler(OperationalError)
+async def handle_query_canceled(request: Request, error: OperationalError):
+    if not is_query_canceled(error):
+        raise error
+
+    return JSONResponse(
+        {'detail': 'Request deadline exceeded'},
+        status_code=HTTPStatus.GATEWAY_TIMEOUT,
+    )
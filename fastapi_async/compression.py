@@ -0,0 +1,180 @@
+import zlib
+from functools import lru_cache
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+GZIP_WBITS = 31
+NEGOTIATION_CACHE_SIZE = 256
+
+
+def _gzip(level: int):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    def compress(data: bytes, final: bool) -> bytes:
+        mode = zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH
+        return compressor.compress(data) + compressor.flush(mode)
+
+    return compress
+
+
+def _brotli(level: int):
+    compressor = brotli.Compressor(quality=level)
+
+    def compress(data: bytes, final: bool) -> bytes:
+        body = compressor.process(data)
+        return body + (compressor.finish() if final else compressor.flush())
+
+    return compress
+
+
+def _zstd(level: int):
+    compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(data: bytes, final: bool) -> bytes:
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_FINISH
+            if final
+            else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        )
+        return compressor.compress(data) + compressor.flush(mode)
+
+    return compress
+
+
+COMPRESSORS = {'gzip': _gzip}
+
+if brotli is not None:
+    COMPRESSORS['br'] = _brotli
+
+if zstandard is not None:
+    COMPRESSORS['zstd'] = _zstd
+
+
+def _quality(params: str) -> float:
+    for param in params.split(';'):
+        name, _, value = param.strip().partition('=')
+        if name == 'q':
+            try:
+                return float(value)
+            except ValueError:
+                return 0
+
+    return 1
+
+
+@lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def negotiate(accept_encoding: str, encodings: tuple[str, ...]) -> str | None:
+    accepted = {}
+    for item in accept_encoding.lower().split(','):
+        coding, _, params = item.partition(';')
+        accepted[coding.strip()] = _quality(params)
+
+    wildcard = accepted.get('*', 0)
+    best, best_quality = None, 0
+
+    # Ties go to the server's preference order in `encodings`.
+    for encoding in encodings:
+        quality = accepted.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+
+    return best
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app,
+        minimum_size: int,
+        encodings: list[str],
+        levels: dict[str, dict[str, int]],
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = tuple(e for e in encodings if e in COMPRESSORS)
+        self.levels = levels
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = Headers(scope=scope).get('accept-encoding', '')
+        encoding = negotiate(accept_encoding, self.encodings)
+
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, encoding, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.downstream = send
+        self.start = None
+        self.compress = None
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.start = message
+            return
+
+        if self.start is not None:
+            start, self.start = self.start, None
+            self._begin(start, message)
+            await self.downstream(start)
+
+        if self.compress is not None and message['type'] == (
+            'http.response.body'
+        ):
+            more_body = message.get('more_body', False)
+            message['body'] = self.compress(
+                message.get('body', b''), not more_body
+            )
+
+        await self.downstream(message)
+
+    def _begin(self, start, message):
+        headers = MutableHeaders(raw=start['headers'])
+        media_type = headers.get('content-type', '').partition(';')[0]
+        level = self.middleware.levels.get(media_type, {}).get(self.encoding)
+
+        if level is None or 'content-encoding' in headers:
+            return
+
+        headers.add_vary_header('Accept-Encoding')
+
+        if message['type'] != 'http.response.body':
+            return
+
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+
+        if not more_body and len(body) < self.middleware.minimum_size:
+            return
+
+        self.compress = COMPRESSORS[self.encoding](level)
+        headers['Content-Encoding'] = self.encoding
+
+        if more_body:
+            del headers['Content-Length']
+            return
+
+        # Whole bodies are compressed up front so Content-Length is exact.
+        message['body'] = self.compress(body, True)
+        self.compress = None
+        headers['Content-Length'] = str(len(message['body']))
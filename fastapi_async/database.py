@@ -1,10 +1,261 @@
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from itertools import count
+
+from fastapi import Request
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy.util.queue import AsyncAdaptedQueue
 
+from fastapi_async.deadlines import apply_deadline, is_query_canceled
+from fastapi_async.metrics import (
+    Counter,
+    Gauge,
+    instrument_engine,
+    register_collector,
+)
 from fastapi_async.settings import Settings
 
-_engine = create_async_engine(Settings().DATABASE_URL)
+POOL_METRICS = {
+    'size': Gauge('db_pool_size', 'Configured pool size.', ('engine',)),
+    'checked_out': Gauge(
+        'db_pool_checked_out', 'Connections checked out.', ('engine',)
+    ),
+    'overflow': Gauge(
+        'db_pool_overflow', 'Overflow connections open.', ('engine',)
+    ),
+    'checkouts': Counter(
+        'db_pool_checkouts_total', 'Pool checkouts.', ('engine',)
+    ),
+    'timeouts': Counter(
+        'db_pool_timeouts_total', 'Pool checkout timeouts.', ('engine',)
+    ),
+    'wait_seconds_total': Counter(
+        'db_pool_wait_seconds_total',
+        'Time spent waiting for a pooled connection.',
+        ('engine',),
+    ),
+    'wait_seconds_max': Gauge(
+        'db_pool_wait_seconds_max',
+        'Longest wait for a pooled connection since the last scrape.',
+        ('engine',),
+    ),
+}
+
+
+class PoolWaitStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record_wait(self, wait_seconds: float):
+        self.wait_seconds_total += wait_seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class TimedQueue(AsyncAdaptedQueue):
+    def __init__(self, maxsize: int = 0, use_lifo: bool = False):
+        super().__init__(maxsize, use_lifo)
+        self.wait_stats = PoolWaitStats()
+
+    def get(self, block: bool = True, timeout: float | None = None):
+        if not block:
+            return super().get(block, timeout)
+
+        # Only the wait for a returned connection is timed here; opening a
+        # new connection happens in the pool after get() gives up.
+        start = time.perf_counter()
+
+        try:
+            return super().get(block, timeout)
+        finally:
+            self.wait_stats.record_wait(time.perf_counter() - start)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    _queue_class = TimedQueue
+
+    @property
+    def wait_stats(self) -> PoolWaitStats:
+        return self._pool.wait_stats
+
+    def _do_get(self):
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.wait_stats.timeouts += 1
+            raise
+
+        self.wait_stats.checkouts += 1
+
+        return connection
+
+
+def build_engine(settings: Settings):
+    statement_options = {
+        'connect_args': {
+            'prepare_threshold': settings.DATABASE_PREPARE_THRESHOLD
+        },
+        'query_cache_size': settings.DATABASE_QUERY_CACHE_SIZE,
+    }
+
+    if settings.DATABASE_NULL_POOL:
+        engine = create_async_engine(
+            settings.DATABASE_URL,
+            poolclass=NullPool,
+            pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+            **statement_options,
+        )
+    else:
+        engine = create_async_engine(
+            settings.DATABASE_URL,
+            **statement_options,
+            poolclass=TimedQueuePool,
+            pool_size=settings.DATABASE_POOL_SIZE,
+            max_overflow=settings.DATABASE_MAX_OVERFLOW,
+            pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+            pool_recycle=settings.DATABASE_POOL_RECYCLE,
+            pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+        )
+
+    return instrument_engine(
+        engine,
+        slow_query_ms=settings.DATABASE_SLOW_QUERY_MS,
+        explain_slow_queries=settings.DATABASE_EXPLAIN_SLOW_QUERIES,
+    )
+
+
+def get_pool_stats(engine) -> dict:
+    pool = engine.pool
+
+    if not isinstance(pool, TimedQueuePool):
+        return {}
+
+    return {
+        'size': pool.size(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+        'checkouts': pool.wait_stats.checkouts,
+        'timeouts': pool.wait_stats.timeouts,
+        'wait_seconds_total': pool.wait_stats.wait_seconds_total,
+        'wait_seconds_max': pool.wait_stats.wait_seconds_max,
+    }
+
 
+class ReplicaRouter:
+    def __init__(
+        self,
+        primary,
+        replicas,
+        eject_seconds: float,
+        read_your_writes_seconds: float,
+    ):
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.eject_seconds = eject_seconds
+        self.read_your_writes_seconds = read_your_writes_seconds
+        self._next = count()
+        self._ejected_until = {}
+        self._recent_writes: OrderedDict[int, float] = OrderedDict()
 
-async def get_session():  # pragma: no cover
+    def record_write(self, user_id: int):
+        now = time.monotonic()
+
+        self._recent_writes[user_id] = now
+        self._recent_writes.move_to_end(user_id)
+
+        while self._recent_writes:
+            oldest = next(iter(self._recent_writes.values()))
+            if now - oldest < self.read_your_writes_seconds:
+                break
+            self._recent_writes.popitem(last=False)
+
+    def wrote_recently(self, user_id: int) -> bool:
+        written_at = self._recent_writes.get(user_id)
+
+        return (
+            written_at is not None
+            and time.monotonic() - written_at < self.read_your_writes_seconds
+        )
+
+    def eject(self, engine):
+        if engine in self.replicas:
+            self._ejected_until[engine] = time.monotonic() + self.eject_seconds
+
+    def engine_for(self, user_id: int | None = None):
+        if user_id is not None and self.wrote_recently(user_id):
+            return self.primary
+
+        now = time.monotonic()
+        for _ in self.replicas:
+            replica = self.replicas[next(self._next) % len(self.replicas)]
+            if self._ejected_until.get(replica, 0) <= now:
+                return replica
+
+        return self.primary
+
+    @asynccontextmanager
+    async def session(self, user_id: int | None = None):
+        engine = self.engine_for(user_id)
+
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            try:
+                yield session
+            except DBAPIError as error:
+                # A statement timeout is the query's fault, not the replica's.
+                if not is_query_canceled(error) and (
+                    error.connection_invalidated
+                    or isinstance(error, (InterfaceError, OperationalError))
+                ):
+                    self.eject(engine)
+                raise
+
+
+_settings = Settings()
+_engine = build_engine(_settings)
+
+replica_router = ReplicaRouter(
+    primary=_engine,
+    replicas=[
+        build_engine(_settings.model_copy(update={'DATABASE_URL': url}))
+        for url in _settings.DATABASE_REPLICA_URLS
+    ],
+    eject_seconds=_settings.DATABASE_REPLICA_EJECT_SECONDS,
+    read_your_writes_seconds=_settings.DATABASE_READ_YOUR_WRITES_SECONDS,
+)
+
+
+def _collect_pool_stats():
+    engines = {
+        'primary': replica_router.primary,
+        **{
+            f'replica-{index}': replica
+            for index, replica in enumerate(replica_router.replicas)
+        },
+    }
+
+    for name, engine in engines.items():
+        for key, value in get_pool_stats(engine).items():
+            POOL_METRICS[key].set(value, name)
+
+        # Each scrape reports the longest wait since the previous one.
+        if isinstance(engine.pool, TimedQueuePool):
+            engine.pool.wait_stats.wait_seconds_max = 0.0
+
+
+register_collector(_collect_pool_stats)
+
+
+async def get_session(request: Request):  # pragma: no cover
     async with AsyncSession(_engine, expire_on_commit=False) as session:
+        apply_deadline(session, request)
         yield session
+
+
+def get_replica_session_factory():  # pragma: no cover
+    return replica_router.session
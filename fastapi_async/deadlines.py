@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+from fastapi import Request
+from psycopg.errors import QueryCanceled
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from fastapi_async.settings import Settings
+
+settings = Settings()
+
+
+def route_deadline_ms(request: Request) -> float | None:
+    route = request.scope.get('route')
+
+    if route is None:
+        return settings.REQUEST_DEADLINE_MS
+
+    return settings.ROUTE_DEADLINES_MS.get(
+        f'{request.method} {route.path}', settings.REQUEST_DEADLINE_MS
+    )
+
+
+def apply_deadline(session: AsyncSession, request: Request):
+    deadline_ms = route_deadline_ms(request)
+
+    if deadline_ms is None:
+        return
+
+    # The clock starts when the request arrived, so time spent queued for
+    # admission or reading the body counts against the deadline too.
+    started_at = request.scope.get('state', {}).get(
+        'request_started_at', time.monotonic()
+    )
+    deadline_at = started_at + deadline_ms / 1000
+
+    # Every transaction gets whatever is left of the request's deadline as
+    # its statement_timeout, so later transactions get less time.
+    def set_statement_timeout(sync_session, transaction, connection):
+        remaining_ms = max(1, int((deadline_at - time.monotonic()) * 1000))
+        connection.exec_driver_sql(
+            f'SET LOCAL statement_timeout = {remaining_ms}'
+        )
+
+    event.listen(session.sync_session, 'after_begin', set_statement_timeout)
+
+
+def is_query_canceled(error: DBAPIError) -> bool:
+    return isinstance(error.orig, QueryCanceled)
+
+
+class CancelOnDisconnectMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        scope.setdefault('state', {})['request_started_at'] = time.monotonic()
+        # One message at a time, so a large body is only read as fast as
+        # the app consumes it.
+        messages = asyncio.Queue(maxsize=1)
+        response_complete = False
+        client_gone = False
+
+        async def send_tracked(message):
+            nonlocal response_complete
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get(
+                'more_body', False
+            ):
+                response_complete = True
+
+        app_task = asyncio.create_task(
+            self.app(scope, messages.get, send_tracked)
+        )
+
+        async def listen():
+            nonlocal client_gone
+            while True:
+                message = await receive()
+
+                # Servers also report a disconnect once the response is
+                # sent; only an early one should cancel the request.
+                if message['type'] == 'http.disconnect' and (
+                    not response_complete
+                ):
+                    client_gone = True
+                    # psycopg asks the server to cancel the running
+                    # query when its task is cancelled.
+                    app_task.cancel()
+                    return
+
+                await messages.put(message)
+
+                if message['type'] == 'http.disconnect':
+                    return
+
+        listener = asyncio.create_task(listen())
+
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            if not client_gone:
+                raise
+        finally:
+            listener.cancel()
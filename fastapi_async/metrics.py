@@ -0,0 +1,361 @@
+import logging
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+EXPLAINABLE_STATEMENTS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+logger = logging.getLogger(__name__)
+
+# Every update happens on the event loop thread, so the metrics below are
+# plain dicts and lists without locks.
+_registry = []
+_collectors = []
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.values = {}
+        _registry.append(self)
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, dict(zip(self.labels, labels)), value
+
+    def set(self, value: float, *labels):
+        self.values[labels] = value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels=(),
+        buckets=LATENCY_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, *labels):
+        series = self.values.get(labels)
+
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0]
+
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            label_values = dict(zip(self.labels, labels))
+            cumulative = 0
+
+            for bound, bucket_count in zip(
+                (*self.buckets, '+Inf'), counts, strict=True
+            ):
+                cumulative += bucket_count
+                yield (
+                    f'{self.name}_bucket',
+                    {**label_values, 'le': str(bound)},
+                    cumulative,
+                )
+
+            yield f'{self.name}_sum', label_values, total
+            yield f'{self.name}_count', label_values, cumulative
+
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+
+def _escape(value) -> str:
+    return (
+        str(value)
+        .replace('\\', r'\\')
+        .replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+def render() -> str:
+    for collector in _collectors:
+        collector()
+
+    lines = []
+    for metric in _registry:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+
+        for name, labels, value in metric.samples():
+            rendered = ','.join(
+                f'{key}="{_escape(label)}"' for key, label in labels.items()
+            )
+            lines.append(
+                f'{name}{{{rendered}}} {value}'
+                if rendered
+                else f'{name} {value}'
+            )
+
+    return '\n'.join(lines) + '\n'
+
+
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route.',
+    labels=('method', 'route', 'status'),
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'http_requests_in_flight',
+    'HTTP requests currently being served.',
+)
+DB_QUERY_SECONDS = Histogram(
+    'db_query_duration_seconds',
+    'Duration of individual database statements.',
+)
+DB_REQUEST_QUERIES = Histogram(
+    'db_queries_per_request',
+    'Database statements executed per HTTP request.',
+    labels=('route',),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_REQUEST_SECONDS = Histogram(
+    'db_request_duration_seconds',
+    'Time spent in the database per HTTP request.',
+    labels=('route',),
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'password_hash_duration_seconds',
+    'Argon2 hashing and verification time.',
+    labels=('operation',),
+)
+ADMISSION_LIMIT = Gauge(
+    'admission_concurrency_limit',
+    'Current concurrency limit by route class.',
+    labels=('route_class',),
+)
+ADMISSION_QUEUED = Gauge(
+    'admission_queued_requests',
+    'Requests waiting for a concurrency slot.',
+    labels=('route_class',),
+)
+ADMISSION_QUEUED_TOTAL = Counter(
+    'admission_queued_requests_total',
+    'Requests that had to wait for a concurrency slot.',
+    labels=('route_class',),
+)
+ADMISSION_REJECTED = Counter(
+    'admission_rejected_requests_total',
+    'Requests shed with a 503 by admission control.',
+    labels=('route_class', 'reason'),
+)
+PRINCIPAL_CACHE_ENTRIES = Gauge(
+    'principal_cache_entries',
+    'Principals cached by access token.',
+)
+PRINCIPAL_CACHE_HITS = Counter(
+    'principal_cache_hits_total',
+    'Principal lookups served without a database round-trip.',
+)
+PRINCIPAL_CACHE_MISSES = Counter(
+    'principal_cache_misses_total',
+    'Principal lookups that went to the database.',
+)
+LOGIN_RATE_LIMITED = Counter(
+    'login_rate_limited_total',
+    'Login attempts rejected by the rate limiter.',
+    labels=('key',),
+)
+
+
+@dataclass(slots=True)
+class RequestStats:
+    queries: int = 0
+    seconds: float = 0
+    statements: list[str] = field(default_factory=list)
+
+
+_request_stats: ContextVar[RequestStats | None] = ContextVar(
+    'request_stats', default=None
+)
+
+
+def _before_cursor_execute(conn, *args):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+def _handle_error(context):
+    if context.connection is None or context.is_disconnect:
+        return
+
+    started_at = context.connection.info.get('query_started_at')
+    if started_at:
+        started_at.pop()
+
+
+def _explain(conn, statement: str, parameters) -> str:
+    # A failing EXPLAIN must not abort the caller's transaction.
+    conn.info['explaining'] = True
+    conn.exec_driver_sql('SAVEPOINT slow_query_explain')
+
+    try:
+        plan = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters)
+        return '\n'.join(row[0] for row in plan)
+    except DBAPIError as error:
+        conn.exec_driver_sql('ROLLBACK TO SAVEPOINT slow_query_explain')
+        return f'EXPLAIN failed: {error.orig}'
+    finally:
+        conn.exec_driver_sql('RELEASE SAVEPOINT slow_query_explain')
+        conn.info['explaining'] = False
+
+
+def _log_slow_query(conn, statement, parameters, elapsed, explain: bool):
+    plan = ''
+    if explain and statement.lstrip().upper().startswith(
+        EXPLAINABLE_STATEMENTS
+    ):
+        plan = '\n' + _explain(conn, statement, parameters)
+
+    logger.warning(
+        'Slow query (%.1f ms): %s; parameters=%r%s',
+        elapsed * 1000,
+        statement,
+        parameters,
+        plan,
+    )
+
+
+def instrument_engine(
+    engine,
+    slow_query_ms: float | None = None,
+    explain_slow_queries: bool = False,
+):
+    def after_cursor_execute(conn, cursor, statement, parameters, *args):
+        *_, executemany = args
+        elapsed = time.perf_counter() - conn.info['query_started_at'].pop()
+
+        if conn.info.get('explaining'):
+            return
+
+        DB_QUERY_SECONDS.observe(elapsed)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+            stats.statements.append(statement)
+
+        if slow_query_ms is not None and elapsed * 1000 >= slow_query_ms:
+            _log_slow_query(
+                conn,
+                statement,
+                parameters,
+                elapsed,
+                explain_slow_queries and not executemany,
+            )
+
+    sync_engine = engine.sync_engine
+
+    event.listen(sync_engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(sync_engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(sync_engine, 'handle_error', _handle_error)
+
+    return engine
+
+
+class MetricsMiddleware:
+    def __init__(self, app, query_budget: int | None = None):
+        self.app = app
+        self.query_budget = query_budget
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = []
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status.append(message['status'])
+            await send(message)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUESTS_IN_FLIGHT.dec()
+            _request_stats.reset(token)
+
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            REQUEST_SECONDS.observe(
+                elapsed,
+                scope['method'],
+                path,
+                str(status[0]) if status else '500',
+            )
+            DB_REQUEST_QUERIES.observe(stats.queries, path)
+            DB_REQUEST_SECONDS.observe(stats.seconds, path)
+
+            if self.query_budget is not None and (
+                stats.queries > self.query_budget
+            ):
+                logger.warning(
+                    '%s %s ran %d queries, over the budget of %d:\n%s',
+                    scope['method'],
+                    path,
+                    stats.queries,
+                    self.query_budget,
+                    '\n'.join(stats.statements),
+                )
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import StrEnum
 
-from sqlalchemy import ForeignKey, func
+from sqlalchemy import DDL, ForeignKey, Index, event, func
 from sqlalchemy.orm import Mapped, mapped_column, registry, relationship
 
 table_registry = registry()
@@ -19,11 +19,22 @@ class User:
         init=False,
         server_default=func.now(),
     )
+    token_version: Mapped[int] = mapped_column(
+        init=False,
+        default=0,
+        server_default='0',
+    )
+    todos_version: Mapped[int] = mapped_column(
+        init=False,
+        default=0,
+        server_default='0',
+    )
 
     todos: Mapped[list['Todo']] = relationship(
         init=False,
         cascade='all, delete-orphan',
-        lazy='selectin',
+        passive_deletes=True,
+        lazy='raise',
     )
 
 
@@ -47,5 +58,120 @@ class Todo:
         init=False,
         server_default=func.now(),
     )
+    updated_at: Mapped[datetime] = mapped_column(
+        init=False,
+        server_default=func.now(),
+        onupdate=func.now(),
+    )
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey('users.id', ondelete='CASCADE')
+    )
+
+    __table_args__ = (
+        Index('ix_todos_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index(
+            'ix_todos_user_id_state_created_at_id',
+            'user_id',
+            'state',
+            'created_at',
+            'id',
+        ),
+        Index(
+            'ix_todos_title_trgm',
+            'title',
+            postgresql_using='gin',
+            postgresql_ops={'title': 'gin_trgm_ops'},
+        ),
+        Index(
+            'ix_todos_description_trgm',
+            'description',
+            postgresql_using='gin',
+            postgresql_ops={'description': 'gin_trgm_ops'},
+        ),
+    )
+
+
+@table_registry.mapped_as_dataclass
+class TableVersion:
+    __tablename__ = 'table_versions'
+
+    name: Mapped[str] = mapped_column(primary_key=True)
+    version: Mapped[int] = mapped_column(default=0, server_default='0')
+
+
+event.listen(
+    Todo.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm'),
+)
+
+BUMP_TODOS_VERSION = """
+CREATE OR REPLACE FUNCTION bump_todos_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    UPDATE users SET todos_version = todos_version + 1
+    WHERE id IN (SELECT DISTINCT user_id FROM changed_todos);
+    RETURN NULL;
+END
+$$
+"""
+
+TODOS_VERSION_TRIGGERS = {
+    'INSERT': 'NEW',
+    'UPDATE': 'NEW',
+    'DELETE': 'OLD',
+}
+
+event.listen(Todo.__table__, 'after_create', DDL(BUMP_TODOS_VERSION))
+
+for operation, transition in TODOS_VERSION_TRIGGERS.items():
+    event.listen(
+        Todo.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TRIGGER todos_version_{operation.lower()} '
+            f'AFTER {operation} ON todos '
+            f'REFERENCING {transition} TABLE AS changed_todos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_todos_version()'
+        ),
+    )
+
+# Every user insert, delete or visible change upserts the one 'users' row,
+# so concurrent user writes queue on its row lock until they commit. User
+# writes are rare, single-statement transactions, so that wait is short.
+BUMP_USERS_VERSION = """
+CREATE OR REPLACE FUNCTION bump_users_version() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    INSERT INTO table_versions (name, version) VALUES ('users', 1)
+    ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1;
+    RETURN NULL;
+END
+$$
+"""
 
-    user_id: Mapped[int] = mapped_column(ForeignKey('users.id'))
+# Only changes to what the user list shows bump the version, so token and
+# todos version updates leave cached lists valid.
+USERS_VERSION_TRIGGERS = {
+    'users_version_insert_delete': (
+        'AFTER INSERT OR DELETE ON users FOR EACH ROW'
+    ),
+    'users_version_update': (
+        'AFTER UPDATE OF username, email ON users FOR EACH ROW '
+        'WHEN (OLD.username IS DISTINCT FROM NEW.username '
+        'OR OLD.email IS DISTINCT FROM NEW.email)'
+    ),
+}
+
+event.listen(User.__table__, 'after_create', DDL(BUMP_USERS_VERSION))
+
+for name, timing in USERS_VERSION_TRIGGERS.items():
+    event.listen(
+        User.__table__,
+        'after_create',
+        DDL(
+            f'CREATE TRIGGER {name} {timing} '
+            'EXECUTE FUNCTION bump_users_version()'
+        ),
+    )
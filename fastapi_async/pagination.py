@@ -0,0 +1,33 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps([
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ])
+
+    return urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, *parsers) -> tuple:
+    try:
+        values = json.loads(urlsafe_b64decode(cursor.encode()))
+
+        if not isinstance(values, list) or len(values) != len(parsers):
+            raise ValueError
+
+        return tuple(
+            parse(value) for parse, value in zip(parsers, values, strict=True)
+        )
+    except (binascii.Error, TypeError, ValueError):
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Invalid cursor',
+        )
@@ -0,0 +1,236 @@
+import math
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+
+from fastapi import HTTPException
+
+from fastapi_async.metrics import LOGIN_RATE_LIMITED
+from fastapi_async.settings import Settings
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # pragma: no cover
+    redis = None
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ShardedMemoryBackend:
+    # Implements the subset of the redis.asyncio client API the limiters
+    # use, so a Redis client can be swapped in without an adapter.
+
+    def __init__(self, shards: int, max_keys: int):
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [OrderedDict() for _ in range(shards)]
+
+    def _shard(self, key: str) -> OrderedDict:
+        return self._shards[hash(key) % len(self._shards)]
+
+    def _live_entry(self, key: str):
+        shard = self._shard(key)
+        entry = shard.get(key)
+
+        if entry is None:
+            return shard, None
+
+        if entry[1] is not None and time.time() >= entry[1]:
+            del shard[key]
+            return shard, None
+
+        shard.move_to_end(key)
+        return shard, entry
+
+    def _store(self, shard: OrderedDict, key: str, entry: list):
+        shard[key] = entry
+        shard.move_to_end(key)
+
+        while len(shard) > self.max_keys_per_shard:
+            shard.popitem(last=False)
+
+    async def get(self, name: str):
+        _, entry = self._live_entry(name)
+        return None if entry is None else entry[0]
+
+    async def set(self, name: str, value, px: int | None = None):
+        expires_at = None if px is None else time.time() + px / 1000
+        self._store(self._shard(name), name, [str(value), expires_at])
+
+    async def incrby(self, name: str, amount: int = 1) -> int:
+        shard, entry = self._live_entry(name)
+        entry = entry or ['0', None]
+        entry[0] = str(int(entry[0]) + amount)
+        self._store(shard, name, entry)
+
+        return int(entry[0])
+
+    async def pexpire(self, name: str, time_ms: int) -> bool:
+        _, entry = self._live_entry(name)
+
+        if entry is None:
+            return False
+
+        entry[1] = time.time() + time_ms / 1000
+        return True
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def clear(self):
+        for shard in self._shards:
+            shard.clear()
+
+
+class TokenBucket:
+    def __init__(self, backend, rate: float, burst: int):
+        self.backend = backend
+        self.rate = rate
+        self.burst = burst
+        self.ttl_ms = math.ceil(burst / rate * 1000)
+
+    async def hit(self, key: str) -> float:
+        now = time.time()
+        tokens, updated_at = self.burst, now
+
+        if (state := await self.backend.get(key)) is not None:
+            tokens, updated_at = map(float, _decode(state).split(':'))
+
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+
+        if tokens < 1:
+            return (1 - tokens) / self.rate
+
+        # A get-then-set race on a shared backend can let a few extra
+        # attempts through; that is acceptable for login throttling.
+        await self.backend.set(key, f'{tokens - 1}:{now}', px=self.ttl_ms)
+
+        return 0
+
+
+class SlidingWindow:
+    def __init__(self, backend, limit: int, window_seconds: float):
+        self.backend = backend
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.ttl_ms = math.ceil(2 * window_seconds * 1000)
+
+    async def retry_after(self, key: str) -> float:
+        window, elapsed = divmod(time.time(), self.window_seconds)
+
+        previous = await self.backend.get(f'{key}:{int(window) - 1}')
+        current = await self.backend.get(f'{key}:{int(window)}')
+
+        # The previous window's count is weighted by how much of it still
+        # overlaps the sliding window ending now.
+        overlap = 1 - elapsed / self.window_seconds
+        estimate = int(previous or 0) * overlap + int(current or 0)
+
+        if estimate >= self.limit:
+            return self.window_seconds - elapsed
+
+        return 0
+
+    async def add(self, key: str):
+        current_key = f'{key}:{int(time.time() // self.window_seconds)}'
+
+        await self.backend.incrby(current_key, 1)
+        await self.backend.pexpire(current_key, self.ttl_ms)
+
+    async def hit(self, key: str) -> float:
+        if retry_after := await self.retry_after(key):
+            return retry_after
+
+        await self.add(key)
+
+        return 0
+
+
+def _username_key(username: str) -> str:
+    return f'login:user:{username.lower()}'
+
+
+class LoginRateLimiter:
+    # Every attempt spends an IP token, but only failed attempts count
+    # against the username, so a user who logs in often is never locked
+    # out by their own successes.
+
+    def __init__(
+        self,
+        backend,
+        by_ip: TokenBucket,
+        by_username: SlidingWindow,
+        enabled: bool = True,
+    ):
+        self.backend = backend
+        self.by_ip = by_ip
+        self.by_username = by_username
+        self.enabled = enabled
+
+    async def retry_after(self, username: str, client_host: str) -> float:
+        if not self.enabled:
+            return 0
+
+        if retry_after := await self.by_ip.hit(f'login:ip:{client_host}'):
+            LOGIN_RATE_LIMITED.inc('ip')
+            return retry_after
+
+        if retry_after := await self.by_username.retry_after(
+            _username_key(username)
+        ):
+            LOGIN_RATE_LIMITED.inc('username')
+            return retry_after
+
+        return 0
+
+    async def record_failure(self, username: str):
+        if self.enabled:
+            await self.by_username.add(_username_key(username))
+
+
+def build_login_rate_limiter(settings: Settings) -> LoginRateLimiter:
+    if settings.LOGIN_RATE_LIMIT_REDIS_URL is None:
+        backend = ShardedMemoryBackend(
+            settings.LOGIN_RATE_LIMIT_SHARDS,
+            settings.LOGIN_RATE_LIMIT_MAX_KEYS,
+        )
+    elif redis is None:
+        raise RuntimeError(
+            'LOGIN_RATE_LIMIT_REDIS_URL needs the ratelimit extra installed'
+        )
+    else:
+        backend = redis.from_url(settings.LOGIN_RATE_LIMIT_REDIS_URL)
+
+    return LoginRateLimiter(
+        backend,
+        TokenBucket(
+            backend,
+            settings.LOGIN_RATE_LIMIT_IP_RATE,
+            settings.LOGIN_RATE_LIMIT_IP_BURST,
+        ),
+        SlidingWindow(
+            backend,
+            settings.LOGIN_RATE_LIMIT_USER_ATTEMPTS,
+            settings.LOGIN_RATE_LIMIT_USER_WINDOW_SECONDS,
+        ),
+        settings.LOGIN_RATE_LIMIT_ENABLED,
+    )
+
+
+login_rate_limiter = build_login_rate_limiter(Settings())
+
+
+async def limit_login_attempts(username: str, client_host: str):
+    retry_after = await login_rate_limiter.retry_after(username, client_host)
+
+    if retry_after:
+        raise HTTPException(
+            status_code=HTTPStatus.TOO_MANY_REQUESTS,
+            detail='Too many login attempts, try again later',
+            headers={'Retry-After': str(math.ceil(retry_after))},
+        )
+
+
+async def record_failed_login(username: str):
+    await login_rate_limiter.record_failure(username)
@@ -0,0 +1,65 @@
+import hashlib
+from functools import cache
+from http import HTTPStatus
+
+from fastapi import Request
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from fastapi_async.settings import Settings
+
+settings = Settings()
+
+
+@cache
+def _adapter(schema) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+
+def fast_json(
+    schema,
+    content,
+    status_code: int = HTTPStatus.OK,
+    headers: dict[str, str] | None = None,
+):
+    if not settings.FAST_JSON_RESPONSES:
+        return content
+
+    # Validate once and let pydantic-core write the bytes, instead of
+    # FastAPI's validate -> serialize to dicts -> json.dumps round trip.
+    adapter = _adapter(schema)
+
+    return Response(
+        adapter.dump_json(
+            adapter.validate_python(content, from_attributes=True)
+        ),
+        status_code=status_code,
+        headers=headers,
+        media_type='application/json',
+    )
+
+
+def list_etag(request: Request, *versions) -> str:
+    raw = repr((request.url.path, request.url.query, *versions))
+
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()}"'
+
+
+def etag_headers(etag: str) -> dict[str, str]:
+    return {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+
+
+def not_modified(request: Request, etag: str) -> Response | None:
+    if_none_match = request.headers.get('if-none-match')
+
+    if not if_none_match:
+        return None
+
+    tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+
+    if '*' not in tags and etag.removeprefix('W/') not in tags:
+        return None
+
+    return Response(
+        status_code=HTTPStatus.NOT_MODIFIED, headers=etag_headers(etag)
+    )
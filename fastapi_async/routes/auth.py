@@ -1,18 +1,20 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select
+from sqlalchemy import lambda_stmt, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing_extensions import Annotated
 
 from fastapi_async.database import get_session
 from fastapi_async.models import User
+from fastapi_async.ratelimit import limit_login_attempts, record_failed_login
 from fastapi_async.schemas import TokenSchema
 from fastapi_async.security import (
+    Principal,
     create_access_token,
     get_current_user,
-    verify_password,
+    verify_password_async,
 )
 
 router = APIRouter(prefix='/auth', tags=['auth'])
@@ -23,37 +25,53 @@ OAuth2Form = Annotated[OAuth2PasswordRequestForm, Depends()]
 
 @router.post('/token', response_model=TokenSchema)
 async def login_for_access_token(
+    request: Request,
     form_data: OAuth2Form,
     session: Session,
 ):
-    user = await session.scalar(
-        select(User).where(
-            (User.username == form_data.username)
-            | (User.email == form_data.username)
-        )
+    username = form_data.username
+    await limit_login_attempts(
+        username, request.client.host if request.client else ''
     )
 
-    if not user:
-        raise HTTPException(
-            status_code=HTTPStatus.UNAUTHORIZED,
-            detail='Incorrect username or password',
+    user = await session.scalar(
+        lambda_stmt(
+            lambda: select(User).where(
+                (User.username == username) | (User.email == username)
+            )
         )
+    )
 
-    if not verify_password(form_data.password, user.password):
+    if not user or not await verify_password_async(
+        form_data.password, user.password
+    ):
+        await record_failed_login(username)
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail='Incorrect username or password',
         )
 
-    token = create_access_token(data={'sub': user.username})
+    token = create_access_token(
+        data={
+            'sub': user.username,
+            'uid': user.id,
+            'ver': user.token_version,
+        }
+    )
 
     return TokenSchema(access_token=token, token_type='Bearer')
 
 
 @router.post('/refresh-token', response_model=TokenSchema)
 async def refresh_access_token(
-    current_user: Annotated[User, Depends(get_current_user)],
+    current_user: Annotated[Principal, Depends(get_current_user)],
 ):
-    token = create_access_token(data={'sub': current_user.username})
+    token = create_access_token(
+        data={
+            'sub': current_user.username,
+            'uid': current_user.id,
+            'ver': current_user.token_version,
+        }
+    )
 
     return TokenSchema(access_token=token, token_type='Bearer')
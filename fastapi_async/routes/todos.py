@@ -1,28 +1,102 @@
+import csv
+import io
+import json
+from datetime import datetime
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, Literal
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from fastapi import (
+    APIRouter,
+    Depends,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy import (
+    delete,
+    func,
+    insert,
+    lambda_stmt,
+    select,
+    tuple_,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from fastapi_async.database import get_session
+from fastapi_async.database import get_session, replica_router
 from fastapi_async.models import Todo, User
+from fastapi_async.pagination import decode_cursor, encode_cursor
+from fastapi_async.responses import (
+    etag_headers,
+    fast_json,
+    list_etag,
+    not_modified,
+)
 from fastapi_async.schemas import (
     FilterTodoSchema,
     Message,
+    TodoBulkCreateSchema,
+    TodoBulkDeleteSchema,
+    TodoBulkResultSchema,
+    TodoBulkStateSchema,
+    TodoImportResultSchema,
     TodoListSchema,
     TodoOutSchema,
     TodoSchema,
     TodoUpdateSchema,
 )
-from fastapi_async.security import get_current_user
+from fastapi_async.security import (
+    Principal,
+    get_current_user,
+    get_read_session,
+)
+from fastapi_async.todo_import import copy_todos
 
 router = APIRouter(tags=['todos'], prefix='/todos')
 
 Session = Annotated[AsyncSession, Depends(get_session)]
-CurrentUser = Annotated[User, Depends(get_current_user)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+CurrentUser = Annotated[Principal, Depends(get_current_user)]
 TodoFilter = Annotated[FilterTodoSchema, Query()]
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = ('id', 'title', 'description', 'state')
+EXPORT_MEDIA_TYPES = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _substring_match(column, value: str, ignore_case: bool):
+    if ignore_case:
+        return column.icontains(value, autoescape=True)
+
+    return column.contains(value, autoescape=True)
+
+
+def _ndjson_chunk(rows) -> str:
+    return ''.join(json.dumps(row._asdict()) + '\n' for row in rows)
+
+
+def _csv_chunk(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+
+    return buffer.getvalue()
+
+
+def _bulk_results(requested_ids: list[int], matched_ids: set[int]) -> dict:
+    return {
+        'results': [
+            {
+                'id': todo_id,
+                'status': HTTPStatus.OK
+                if todo_id in matched_ids
+                else HTTPStatus.NOT_FOUND,
+            }
+            for todo_id in requested_ids
+        ]
+    }
+
 
 @router.post(
     '/',
@@ -34,39 +108,244 @@ async def create_todo(
     session: Session,
     current_user: CurrentUser,
 ):
-    todo = Todo(**todo.model_dump(), user_id=current_user.id)
-
-    session.add(todo)
+    db_todo = await session.scalar(
+        insert(Todo)
+        .values(**todo.model_dump(), user_id=current_user.id)
+        .returning(Todo)
+    )
     await session.commit()
-    await session.refresh(todo)
+    replica_router.record_write(current_user.id)
 
-    return todo
+    return fast_json(TodoOutSchema, db_todo, HTTPStatus.CREATED)
 
 
 @router.get(
     '/',
     response_model=TodoListSchema,
+    responses={HTTPStatus.NOT_MODIFIED: {'description': 'Not Modified'}},
 )
 async def list_todos(
-    session: Session,
+    request: Request,
+    response: Response,
+    session: ReadSession,
     current_user: CurrentUser,
     todo_filter: TodoFilter,
 ):
-    query = select(Todo).where(Todo.user_id == current_user.id)
+    user_id = current_user.id
+    todos_version = await session.scalar(
+        lambda_stmt(
+            lambda: select(User.todos_version).where(User.id == user_id)
+        )
+    )
+    etag = list_etag(request, user_id, todos_version)
+
+    if cached := not_modified(request, etag):
+        return cached
+
+    query = select(Todo).where(Todo.user_id == user_id)
+    relevance = []
 
     if todo_filter.title:
-        query = query.where(Todo.title.contains(todo_filter.title))
+        query = query.where(
+            _substring_match(
+                Todo.title, todo_filter.title, todo_filter.ignore_case
+            )
+        )
+        relevance.append(func.similarity(todo_filter.title, Todo.title))
 
     if todo_filter.description:
-        query = query.where(Todo.description.contains(todo_filter.description))
+        query = query.where(
+            _substring_match(
+                Todo.description,
+                todo_filter.description,
+                todo_filter.ignore_case,
+            )
+        )
+        relevance.append(
+            func.similarity(todo_filter.description, Todo.description)
+        )
 
     if todo_filter.state:
         query = query.where(Todo.state == todo_filter.state)
 
-    todos = await session.scalars(
-        query.limit(todo_filter.limit).offset(todo_filter.offset),
+    ranked = todo_filter.rank and bool(relevance)
+
+    if ranked and todo_filter.cursor:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail='Cursor pagination is not available with rank',
+        )
+
+    if todo_filter.cursor:
+        created_at, todo_id = decode_cursor(
+            todo_filter.cursor, datetime.fromisoformat, int
+        )
+        query = query.where(
+            tuple_(Todo.created_at, Todo.id) > tuple_(created_at, todo_id)
+        )
+
+    if ranked:
+        query = query.order_by(sum(relevance).desc(), Todo.id)
+    else:
+        query = query.order_by(Todo.created_at, Todo.id)
+
+    todos = (
+        await session.scalars(
+            query.limit(todo_filter.limit).offset(todo_filter.offset),
+        )
+    ).all()
+
+    next_cursor = None
+    if len(todos) == todo_filter.limit and not ranked:
+        next_cursor = encode_cursor(todos[-1].created_at, todos[-1].id)
+
+    headers = etag_headers(etag)
+    response.headers.update(headers)
+
+    return fast_json(
+        TodoListSchema,
+        {'todos': todos, 'next_cursor': next_cursor},
+        headers=headers,
+    )
+
+
+@router.get(
+    '/export',
+    response_class=StreamingResponse,
+    responses={
+        HTTPStatus.OK: {
+            'content': {
+                media_type: {} for media_type in EXPORT_MEDIA_TYPES.values()
+            }
+        }
+    },
+)
+async def export_todos(
+    session: ReadSession,
+    current_user: CurrentUser,
+    export_format: Annotated[
+        Literal['ndjson', 'csv'], Query(alias='format')
+    ] = 'ndjson',
+):
+    user_id = current_user.id
+    result = await session.stream(
+        select(*(getattr(Todo, column) for column in EXPORT_COLUMNS))
+        .where(Todo.user_id == user_id)
+        .order_by(Todo.created_at, Todo.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    async def rows():
+        if export_format == 'csv':
+            yield _csv_chunk([EXPORT_COLUMNS])
+
+        chunk = _csv_chunk if export_format == 'csv' else _ndjson_chunk
+        async for partition in result.partitions():
+            yield chunk(partition)
+
+    return StreamingResponse(
+        rows(),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            'Content-Disposition': (
+                f'attachment; filename=todos.{export_format}'
+            )
+        },
+    )
+
+
+@router.post(
+    '/import',
+    response_model=TodoImportResultSchema,
+    openapi_extra={
+        'requestBody': {
+            'required': True,
+            'content': {
+                media_type: {'schema': {'type': 'string'}}
+                for media_type in EXPORT_MEDIA_TYPES.values()
+            },
+        }
+    },
+)
+async def import_todos(
+    request: Request,
+    session: Session,
+    current_user: CurrentUser,
+    import_format: Annotated[
+        Literal['ndjson', 'csv'], Query(alias='format')
+    ] = 'ndjson',
+):
+    result = await copy_todos(
+        session, current_user.id, request.stream(), import_format
+    )
+    await session.commit()
+    replica_router.record_write(current_user.id)
+
+    return result
+
+
+@router.post(
+    '/bulk',
+    status_code=HTTPStatus.CREATED,
+    response_model=TodoListSchema,
+)
+async def create_todos_bulk(
+    bulk: TodoBulkCreateSchema,
+    session: Session,
+    current_user: CurrentUser,
+):
+    todos = (
+        await session.scalars(
+            insert(Todo)
+            .returning(Todo, sort_by_parameter_order=True)
+            .execution_options(render_nulls=True),
+            [
+                {**todo.model_dump(), 'user_id': current_user.id}
+                for todo in bulk.todos
+            ],
+        )
+    ).all()
+    await session.commit()
+    replica_router.record_write(current_user.id)
+
+    return fast_json(TodoListSchema, {'todos': todos}, HTTPStatus.CREATED)
+
+
+@router.patch('/bulk', response_model=TodoBulkResultSchema)
+async def update_todos_state_bulk(
+    bulk: TodoBulkStateSchema,
+    session: Session,
+    current_user: CurrentUser,
+):
+    updated_ids = await session.scalars(
+        update(Todo)
+        .where(Todo.user_id == current_user.id, Todo.id.in_(bulk.ids))
+        .values(state=bulk.state)
+        .returning(Todo.id)
     )
-    return {'todos': todos.all()}
+    results = _bulk_results(bulk.ids, set(updated_ids))
+    await session.commit()
+    replica_router.record_write(current_user.id)
+
+    return results
+
+
+@router.delete('/bulk', response_model=TodoBulkResultSchema)
+async def delete_todos_bulk(
+    bulk: TodoBulkDeleteSchema,
+    session: Session,
+    current_user: CurrentUser,
+):
+    deleted_ids = await session.scalars(
+        delete(Todo)
+        .where(Todo.user_id == current_user.id, Todo.id.in_(bulk.ids))
+        .returning(Todo.id)
+    )
+    results = _bulk_results(bulk.ids, set(deleted_ids))
+    await session.commit()
+    replica_router.record_write(current_user.id)
+
+    return results
 
 
 @router.delete(
@@ -79,18 +358,25 @@ async def delete_todo(
     session: Session,
     current_user: CurrentUser,
 ):
-    todo = await session.scalar(
-        select(Todo).where(Todo.id == todo_id, Todo.user_id == current_user.id)
+    user_id = current_user.id
+    deleted_id = await session.scalar(
+        lambda_stmt(
+            lambda: (
+                delete(Todo)
+                .where(Todo.id == todo_id, Todo.user_id == user_id)
+                .returning(Todo.id)
+            )
+        )
     )
 
-    if not todo:
+    if deleted_id is None:
         raise HTTPException(
             status_code=HTTPStatus.NOT_FOUND,
             detail='Task not found',
         )
 
-    await session.delete(todo)
     await session.commit()
+    replica_router.record_write(current_user.id)
 
     return Message(message='Task deleted successfully!')
 
@@ -102,8 +388,15 @@ async def update_todo(
     session: Session,
     current_user: CurrentUser,
 ):
+    values = todo_data.model_dump(exclude_unset=True)
+    query = (
+        update(Todo).values(**values).returning(Todo)
+        if values
+        else select(Todo)
+    )
+
     todo = await session.scalar(
-        select(Todo).where(Todo.id == todo_id, Todo.user_id == current_user.id)
+        query.where(Todo.id == todo_id, Todo.user_id == current_user.id)
     )
 
     if not todo:
@@ -112,10 +405,7 @@ async def update_todo(
             detail='Task not found',
         )
 
-    for key, value in todo_data.model_dump(exclude_unset=True).items():
-        setattr(todo, key, value)
-
     await session.commit()
-    await session.refresh(todo)
+    replica_router.record_write(current_user.id)
 
-    return todo
+    return fast_json(TodoOutSchema, todo)
@@ -1,12 +1,20 @@
 from http import HTTPStatus
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy import select
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import delete, lambda_stmt, select, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing_extensions import Annotated
 
-from fastapi_async.database import get_session
-from fastapi_async.models import User
+from fastapi_async.database import get_session, replica_router
+from fastapi_async.models import TableVersion, User
+from fastapi_async.pagination import decode_cursor, encode_cursor
+from fastapi_async.responses import (
+    etag_headers,
+    fast_json,
+    list_etag,
+    not_modified,
+)
 from fastapi_async.schemas import (
     ErrorSchema,
     FilterPageSchema,
@@ -15,11 +23,18 @@ from fastapi_async.schemas import (
     UserOutSchema,
     UserSchema,
 )
-from fastapi_async.security import get_current_user, get_hashed_password
+from fastapi_async.security import (
+    Principal,
+    get_current_user,
+    get_hashed_password_async,
+    get_read_session,
+    principal_cache,
+)
 
 router = APIRouter(prefix='/users', tags=['users'])
 Session = Annotated[AsyncSession, Depends(get_session)]
-CurrentUser = Annotated[User, Depends(get_current_user)]
+ReadSession = Annotated[AsyncSession, Depends(get_read_session)]
+CurrentUser = Annotated[Principal, Depends(get_current_user)]
 
 
 @router.post(
@@ -28,42 +43,82 @@ CurrentUser = Annotated[User, Depends(get_current_user)]
     response_model=UserOutSchema,
 )
 async def create_user(user: UserSchema, session: Session):
+    hashed_password = await get_hashed_password_async(user.password)
+
     db_user = await session.scalar(
-        select(User).where(
-            (User.email == user.email) | (User.username == user.username)
+        insert(User)
+        .values(
+            **user.model_dump(exclude={'password'}),
+            password=hashed_password,
         )
+        .on_conflict_do_nothing()
+        .returning(User)
     )
+    await session.commit()
 
-    if db_user:
+    if db_user is None:
         raise HTTPException(
             status_code=HTTPStatus.CONFLICT,
             detail='User with this email or username already exists!',
         )
 
-    db_user = User(**user.model_dump())
-    db_user.password = get_hashed_password(user.password)
-
-    session.add(db_user)
-    await session.commit()
-    await session.refresh(db_user)
+    replica_router.record_write(db_user.id)
 
-    return db_user
+    return fast_json(UserOutSchema, db_user, HTTPStatus.CREATED)
 
 
 @router.get(
     '/',
     status_code=HTTPStatus.OK,
     response_model=UserListSchema,
+    responses={HTTPStatus.NOT_MODIFIED: {'description': 'Not Modified'}},
 )
 async def list_users(
-    session: Session,
+    request: Request,
+    response: Response,
+    session: ReadSession,
     current_user: CurrentUser,
     filter_page: Annotated[FilterPageSchema, Query()],
 ):
-    users = await session.scalars(
-        (select(User).limit(filter_page.limit).offset(filter_page.offset))
+    users_version = await session.scalar(
+        lambda_stmt(
+            lambda: select(TableVersion.version).where(
+                TableVersion.name == User.__tablename__
+            )
+        )
+    )
+    etag = list_etag(request, users_version)
+
+    if cached := not_modified(request, etag):
+        return cached
+
+    query = select(User)
+
+    if filter_page.cursor:
+        (user_id,) = decode_cursor(filter_page.cursor, int)
+        query = query.where(User.id > user_id)
+
+    users = (
+        await session.scalars(
+            query
+            .order_by(User.id)
+            .limit(filter_page.limit)
+            .offset(filter_page.offset)
+        )
+    ).all()
+
+    next_cursor = None
+    if len(users) == filter_page.limit:
+        next_cursor = encode_cursor(users[-1].id)
+
+    headers = etag_headers(etag)
+    response.headers.update(headers)
+
+    return fast_json(
+        UserListSchema,
+        {'users': users, 'next_cursor': next_cursor},
+        headers=headers,
     )
-    return {'users': users}
 
 
 @router.put(
@@ -84,10 +139,13 @@ async def update_user(
             detail='You do not have permission to update this user!',
         )
 
+    username, email = user.username, user.email
     existing_user = await session.scalar(
-        select(User).where(
-            ((User.email == user.email) | (User.username == user.username))
-            & (User.id != user_id)
+        lambda_stmt(
+            lambda: select(User).where(
+                ((User.email == email) | (User.username == username))
+                & (User.id != user_id)
+            )
         )
     )
 
@@ -97,15 +155,23 @@ async def update_user(
             detail='User with this email or username already exists!',
         )
 
-    for key, value in user.model_dump().items():
-        setattr(current_user, key, value)
-
-    current_user.password = get_hashed_password(user.password)
+    hashed_password = await get_hashed_password_async(user.password)
 
+    db_user = await session.scalar(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            **user.model_dump(exclude={'password'}),
+            password=hashed_password,
+            token_version=User.token_version + 1,
+        )
+        .returning(User)
+    )
     await session.commit()
-    await session.refresh(current_user)
+    replica_router.record_write(user_id)
+    principal_cache.invalidate_user(user_id)
 
-    return current_user
+    return fast_json(UserOutSchema, db_user)
 
 
 @router.delete(
@@ -125,7 +191,12 @@ async def delete_user(
             detail='You do not have permission to delete this user!',
         )
 
-    await session.delete(current_user)
+    # The todos go with the user through ON DELETE CASCADE.
+    await session.execute(
+        lambda_stmt(lambda: delete(User).where(User.id == user_id))
+    )
     await session.commit()
+    replica_router.record_write(user_id)
+    principal_cache.invalidate_user(user_id)
 
     return Message(message='User deleted successfully!')
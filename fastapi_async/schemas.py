@@ -2,6 +2,8 @@ from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 from fastapi_async.models import TodoState
 
+TODO_BULK_MAX_ITEMS = 100
+
 
 class Message(BaseModel):
     message: str
@@ -27,6 +29,7 @@ class UserOutSchema(BaseModel):
 
 class UserListSchema(BaseModel):
     users: list[UserOutSchema]
+    next_cursor: str | None = None
 
 
 class TokenSchema(BaseModel):
@@ -37,6 +40,7 @@ class TokenSchema(BaseModel):
 class FilterPageSchema(BaseModel):
     limit: int = Field(10, ge=1)
     offset: int = Field(0, ge=0)
+    cursor: str | None = None
 
 
 class TodoSchema(BaseModel):
@@ -55,13 +59,50 @@ class FilterTodoSchema(FilterPageSchema):
     title: str | None = Field(default=None, min_length=3)
     description: str | None = None
     state: TodoState | None = None
+    ignore_case: bool = False
+    rank: bool = False
 
 
 class TodoListSchema(BaseModel):
     todos: list[TodoOutSchema]
+    next_cursor: str | None = None
 
 
 class TodoUpdateSchema(BaseModel):
     title: str | None = None
     description: str | None = None
     state: TodoState | None = None
+
+
+class TodoBulkCreateSchema(BaseModel):
+    todos: list[TodoSchema] = Field(
+        min_length=1, max_length=TODO_BULK_MAX_ITEMS
+    )
+
+
+class TodoBulkDeleteSchema(BaseModel):
+    ids: list[int] = Field(min_length=1, max_length=TODO_BULK_MAX_ITEMS)
+
+
+class TodoBulkStateSchema(TodoBulkDeleteSchema):
+    state: TodoState
+
+
+class TodoBulkItemResultSchema(BaseModel):
+    id: int
+    status: int
+
+
+class TodoBulkResultSchema(BaseModel):
+    results: list[TodoBulkItemResultSchema]
+
+
+class TodoImportErrorSchema(BaseModel):
+    line: int
+    detail: str
+
+
+class TodoImportResultSchema(BaseModel):
+    imported: int
+    failed: int
+    errors: list[TodoImportErrorSchema]
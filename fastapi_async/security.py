@@ -1,8 +1,14 @@
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from http import HTTPStatus
+from threading import BoundedSemaphore
 from zoneinfo import ZoneInfo
 
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from jwt import (
     DecodeError,
@@ -12,10 +18,17 @@ from jwt import (
     encode,
 )
 from pwdlib import PasswordHash
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import lambda_stmt, select
 
-from fastapi_async.database import get_session
+from fastapi_async.database import get_replica_session_factory, replica_router
+from fastapi_async.deadlines import apply_deadline
+from fastapi_async.metrics import (
+    PASSWORD_HASH_SECONDS,
+    PRINCIPAL_CACHE_ENTRIES,
+    PRINCIPAL_CACHE_HITS,
+    PRINCIPAL_CACHE_MISSES,
+    register_collector,
+)
 from fastapi_async.models import User
 from fastapi_async.settings import Settings
 
@@ -23,6 +36,96 @@ pwd_context = PasswordHash.recommended()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/token')
 settings = Settings()
 
+_hash_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS,
+    thread_name_prefix='password-hash',
+)
+_hash_slots = BoundedSemaphore(settings.PASSWORD_HASH_MAX_PENDING)
+
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    id: int
+    username: str
+    token_version: int
+
+
+class PrincipalCache:
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[Principal, float]] = (
+            OrderedDict()
+        )
+
+    def get(self, token: str) -> Principal | None:
+        entry = self._entries.get(token)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        principal, expires_at = entry
+
+        if time.time() >= expires_at:
+            del self._entries[token]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(token)
+        self.hits += 1
+        return principal
+
+    def set(self, token: str, principal: Principal, token_exp: float):
+        expires_at = min(token_exp, time.time() + self.ttl_seconds)
+
+        self._entries[token] = (principal, expires_at)
+        self._entries.move_to_end(token)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int):
+        stale_tokens = [
+            token
+            for token, (principal, _) in self._entries.items()
+            if principal.id == user_id
+        ]
+
+        for token in stale_tokens:
+            del self._entries[token]
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+principal_cache = PrincipalCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
+
+
+def _collect_principal_cache_stats():
+    stats = principal_cache.stats()
+
+    PRINCIPAL_CACHE_ENTRIES.set(stats['size'])
+    PRINCIPAL_CACHE_HITS.set(stats['hits'])
+    PRINCIPAL_CACHE_MISSES.set(stats['misses'])
+
+
+register_collector(_collect_principal_cache_stats)
+
 
 def get_hashed_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -32,6 +135,46 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+async def _run_in_hash_executor(func, *args):
+    if not _hash_slots.acquire(blocking=False):
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail='Server is busy, try again later',
+            headers={'Retry-After': '1'},
+        )
+
+    try:
+        loop = asyncio.get_running_loop()
+        result, seconds = await loop.run_in_executor(
+            _hash_executor, _timed, func, *args
+        )
+    finally:
+        _hash_slots.release()
+
+    PASSWORD_HASH_SECONDS.observe(seconds, func.__name__)
+
+    return result
+
+
+async def get_hashed_password_async(password: str) -> str:
+    return await _run_in_hash_executor(get_hashed_password, password)
+
+
+async def verify_password_async(
+    plain_password: str, hashed_password: str
+) -> bool:
+    return await _run_in_hash_executor(
+        verify_password, plain_password, hashed_password
+    )
+
+
 def create_access_token(data: dict) -> str:
     to_encode = data.copy()
 
@@ -44,9 +187,14 @@ def create_access_token(data: dict) -> str:
 
 
 async def get_current_user(
-    session: AsyncSession = Depends(get_session),
     token: str = Depends(oauth2_scheme),
-) -> User:
+    replica_session=Depends(get_replica_session_factory),
+) -> Principal:
+    principal = principal_cache.get(token)
+
+    if principal is not None:
+        return principal
+
     try:
         payload = decode(
             token,
@@ -81,17 +229,49 @@ async def get_current_user(
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-    user = await session.scalar(
-        select(User).where(
-            (User.username == user_name) | (User.email == user_name)
+    user_id: int | None = payload.get('uid')
+
+    if user_id is not None:
+        query = lambda_stmt(
+            lambda: select(User.id, User.username, User.token_version).where(
+                User.id == user_id
+            )
+        )
+    else:
+        query = lambda_stmt(
+            lambda: select(User.id, User.username, User.token_version).where(
+                (User.username == user_name) | (User.email == user_name)
+            )
         )
-    )
 
-    if user is None:
+    # A short-lived session keeps the lookup from holding a connection
+    # while the route runs; routing by uid keeps read-your-writes.
+    async with replica_session(user_id) as session:
+        user = (await session.execute(query)).first()
+
+    if user is None or (
+        user_id is not None and payload.get('ver') != user.token_version
+    ):
         raise HTTPException(
             status_code=HTTPStatus.UNAUTHORIZED,
             detail='Could not validate credentials',
             headers={'WWW-Authenticate': 'Bearer'},
         )
 
-    return user
+    principal = Principal(
+        id=user.id,
+        username=user.username,
+        token_version=user.token_version,
+    )
+    principal_cache.set(token, principal, payload.get('exp', float('inf')))
+
+    return principal
+
+
+async def get_read_session(
+    request: Request,
+    current_user: Principal = Depends(get_current_user),
+):  # pragma: no cover
+    async with replica_router.session(current_user.id) as session:
+        apply_deadline(session, request)
+        yield session
@@ -8,6 +8,57 @@ class Settings(BaseSettings):
     )
 
     DATABASE_URL: str
+    DATABASE_POOL_SIZE: int = 5
+    DATABASE_MAX_OVERFLOW: int = 10
+    DATABASE_POOL_TIMEOUT: float = 30
+    DATABASE_POOL_RECYCLE: int = -1
+    DATABASE_POOL_PRE_PING: bool = False
+    DATABASE_NULL_POOL: bool = False
+    DATABASE_PREPARE_THRESHOLD: int | None = 5
+    DATABASE_QUERY_CACHE_SIZE: int = 500
+    DATABASE_REPLICA_URLS: list[str] = []
+    DATABASE_REPLICA_EJECT_SECONDS: float = 30
+    DATABASE_READ_YOUR_WRITES_SECONDS: float = 5
+    DATABASE_SLOW_QUERY_MS: float | None = 500
+    DATABASE_EXPLAIN_SLOW_QUERIES: bool = False
+    DATABASE_QUERY_BUDGET: int | None = None
+    REQUEST_DEADLINE_MS: float | None = 10_000
+    ROUTE_DEADLINES_MS: dict[str, float] = {
+        'GET /todos/': 2_000,
+        'GET /todos/export': 60_000,
+        'POST /todos/import': 60_000,
+    }
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_PENDING: int = 64
+
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10_000
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+
+    LOGIN_RATE_LIMIT_ENABLED: bool = True
+    LOGIN_RATE_LIMIT_IP_RATE: float = 1
+    LOGIN_RATE_LIMIT_IP_BURST: int = 20
+    LOGIN_RATE_LIMIT_USER_ATTEMPTS: int = 10
+    LOGIN_RATE_LIMIT_USER_WINDOW_SECONDS: float = 60
+    LOGIN_RATE_LIMIT_SHARDS: int = 16
+    LOGIN_RATE_LIMIT_MAX_KEYS: int = 100_000
+    LOGIN_RATE_LIMIT_REDIS_URL: str | None = None
+
+    ADMISSION_LIMITS: dict[str, int] = {'auth': 8, 'reads': 64, 'writes': 32}
+    ADMISSION_MAX_QUEUE: int = 128
+    ADMISSION_QUEUE_TIMEOUT: float = 5
+    ADMISSION_RETRY_AFTER_SECONDS: int = 1
+    ADMISSION_TARGET_LATENCY_MS: float | None = None
+
+    FAST_JSON_RESPONSES: bool = False
+
+    COMPRESSION_MINIMUM_SIZE: int = 1024
+    COMPRESSION_ENCODINGS: list[str] = ['zstd', 'br', 'gzip']
+    COMPRESSION_LEVELS: dict[str, dict[str, int]] = {
+        'application/json': {'zstd': 3, 'br': 4, 'gzip': 6},
+        'application/x-ndjson': {'zstd': 1, 'br': 1, 'gzip': 1},
+        'text/csv': {'zstd': 1, 'br': 1, 'gzip': 1},
+    }
@@ -0,0 +1,282 @@
+import argparse
+import asyncio
+import codecs
+import csv
+import json
+import re
+from collections import deque
+from pathlib import Path
+
+from psycopg import DataError
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from fastapi_async.database import build_engine
+from fastapi_async.schemas import TodoSchema
+from fastapi_async.settings import Settings
+
+IMPORT_MAX_ERRORS = 100
+IMPORT_READ_SIZE = 64 * 1024
+IMPORT_CHUNK_ROWS = 1000
+IMPORT_MAX_RECORD_LINES = 100
+IMPORT_MAX_RECORD_CHARS = 256 * 1024
+COPY_TODOS = 'COPY todos (title, description, state, user_id) FROM STDIN'
+COPY_LINE = re.compile(r'COPY todos, line (\d+)')
+
+
+async def _lines(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split('\n')
+
+        for line in lines:
+            yield line + '\n'
+
+        # An overlong line is kept just long enough for _records to
+        # reject it, so it never has to fit in memory.
+        pending = pending[: IMPORT_MAX_RECORD_CHARS + 1]
+
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+async def _numbered(lines):
+    line_number = 0
+
+    async for line in lines:
+        line_number += 1
+        yield line_number, line
+
+
+async def _records(lines, import_format: str):
+    numbered = _numbered(lines)
+    replay = deque()
+    record = []
+    size = 0
+    quotes = 0
+
+    while True:
+        item = replay.popleft() if replay else await anext(numbered, None)
+
+        if item is None and not record:
+            return
+
+        if item is not None:
+            record.append(item)
+            size += len(item[1])
+            quotes += item[1].count('"')
+
+        # A CSV record only ends on a line where every quote is closed.
+        # One still open at the limits or the end of the upload is reported
+        # and the lines after its first are read again as new records.
+        if import_format == 'csv' and quotes % 2:
+            if item is not None and (
+                len(record) < IMPORT_MAX_RECORD_LINES
+                and size <= IMPORT_MAX_RECORD_CHARS
+            ):
+                continue
+
+            yield record[0][0], None, 'row: unclosed quote'
+            replay.extendleft(reversed(record[1:]))
+        elif size > IMPORT_MAX_RECORD_CHARS:
+            yield (
+                record[0][0],
+                None,
+                f'row: longer than {IMPORT_MAX_RECORD_CHARS} characters',
+            )
+        elif (text := ''.join(line for _, line in record)).strip():
+            yield record[0][0], text, None
+
+        record = []
+        size = 0
+        quotes = 0
+
+
+def _validate(validator, data) -> TodoSchema | str:
+    try:
+        todo = validator(data)
+    except ValidationError as error:
+        return '; '.join(
+            f'{".".join(map(str, item["loc"])) or "row"}: {item["msg"]}'
+            for item in error.errors()
+        )
+
+    # COPY refuses NUL characters; catching them here keeps the retry in
+    # _copy_chunk for the rare errors only the server can find.
+    for field, value in todo:
+        if isinstance(value, str) and '\x00' in value:
+            return f'{field}: NUL characters are not allowed'
+
+    return todo
+
+
+async def _todos(chunks, import_format: str):
+    header = None
+
+    async for line_number, record, error in _records(
+        _lines(chunks), import_format
+    ):
+        if error is not None:
+            yield line_number, error
+            continue
+
+        if import_format == 'ndjson':
+            yield (
+                line_number,
+                _validate(TodoSchema.model_validate_json, record),
+            )
+            continue
+
+        try:
+            row = next(csv.reader([record]))
+        except csv.Error as error:
+            yield line_number, f'row: {error}'
+            continue
+
+        if header is None:
+            header = row
+            continue
+
+        if len(row) != len(header):
+            yield (
+                line_number,
+                f'row: expected {len(header)} columns, got {len(row)}',
+            )
+            continue
+
+        values = {
+            column: value
+            for column, value in zip(header, row, strict=True)
+            if value
+        }
+        yield line_number, _validate(TodoSchema.model_validate, values)
+
+
+def _failed_row(error: DataError, written: int) -> int:
+    # The server names the rejected line of the COPY data; errors raised
+    # while dumping a row come from the row being written.
+    if match := COPY_LINE.match(error.diag.context or ''):
+        return int(match.group(1)) - 1
+
+    return written
+
+
+async def _copy_chunk(connection: AsyncConnection, cursor, rows: list):
+    rows = list(rows)
+    errors = []
+
+    # Each chunk runs in a savepoint, so a rejected row only costs a retry
+    # of the chunk without it.
+    while rows:
+        written = 0
+        try:
+            async with connection.begin_nested():
+                async with cursor.copy(COPY_TODOS) as copy:
+                    for _, values in rows:
+                        await copy.write_row(values)
+                        written += 1
+        except DataError as error:
+            line_number, _ = rows.pop(_failed_row(error, written))
+            errors.append((
+                line_number,
+                error.diag.message_primary or str(error),
+            ))
+        else:
+            return len(rows), errors
+
+    return 0, errors
+
+
+async def copy_todos(
+    session: AsyncSession,
+    user_id: int,
+    chunks,
+    import_format: str,
+) -> dict:
+    imported = 0
+    failed = 0
+    errors = []
+    rows = []
+
+    def add_errors(row_errors):
+        nonlocal failed
+        failed += len(row_errors)
+        for line_number, detail in row_errors:
+            if len(errors) < IMPORT_MAX_ERRORS:
+                errors.append({'line': line_number, 'detail': detail})
+
+    connection = await session.connection()
+    raw_connection = await connection.get_raw_connection()
+
+    async with raw_connection.driver_connection.cursor() as cursor:
+        async for line_number, todo in _todos(chunks, import_format):
+            if isinstance(todo, str):
+                add_errors([(line_number, todo)])
+                continue
+
+            rows.append((
+                line_number,
+                (todo.title, todo.description, todo.state.name, user_id),
+            ))
+
+            if len(rows) == IMPORT_CHUNK_ROWS:
+                copied, row_errors = await _copy_chunk(
+                    connection, cursor, rows
+                )
+                imported += copied
+                add_errors(row_errors)
+                rows = []
+
+        copied, row_errors = await _copy_chunk(connection, cursor, rows)
+        imported += copied
+        add_errors(row_errors)
+
+    errors.sort(key=lambda error: error['line'])
+
+    return {'imported': imported, 'failed': failed, 'errors': errors}
+
+
+async def _file_chunks(path: Path):
+    with path.open('rb') as file:
+        while chunk := file.read(IMPORT_READ_SIZE):
+            yield chunk
+
+
+async def _import_file(path: Path, user_id: int, import_format: str) -> dict:
+    engine = build_engine(Settings())
+
+    try:
+        async with AsyncSession(engine) as session:
+            result = await copy_todos(
+                session, user_id, _file_chunks(path), import_format
+            )
+            await session.commit()
+    finally:
+        await engine.dispose()
+
+    return result
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        description='Bulk import todos for a user with COPY.'
+    )
+    parser.add_argument('path', type=Path)
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--format', choices=('ndjson', 'csv'))
+    args = parser.parse_args(argv)
+
+    import_format = args.format or args.path.suffix.lstrip('.')
+    if import_format not in {'ndjson', 'csv'}:
+        parser.error('cannot infer --format from the file extension')
+
+    result = asyncio.run(_import_file(args.path, args.user_id, import_format))
+    print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""maintain a users list version
+
+Revision ID: a9d4c61e2f70
+Revises: f3a7c2e91b08
+Create Date: 2026-10-18 19:41:08.372615
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d4c61e2f70'
+down_revision: Union[str, Sequence[str], None] = 'f3a7c2e91b08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = {
+    'users_version_insert_delete': 'AFTER INSERT OR DELETE ON users FOR EACH ROW',
+    'users_version_update': (
+        'AFTER UPDATE OF username, email ON users FOR EACH ROW '
+        'WHEN (OLD.username IS DISTINCT FROM NEW.username '
+        'OR OLD.email IS DISTINCT FROM NEW.email)'
+    ),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('table_versions',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('version', sa.Integer(), server_default='0', nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+    op.execute("INSERT INTO table_versions (name, version) VALUES ('users', 0)")
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_users_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            INSERT INTO table_versions (name, version) VALUES ('users', 1)
+            ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1;
+            RETURN NULL;
+        END
+        $$
+    """)
+    for name, timing in TRIGGERS.items():
+        op.execute(
+            f'CREATE TRIGGER {name} {timing} '
+            'EXECUTE FUNCTION bump_users_version()'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in TRIGGERS:
+        op.execute(f'DROP TRIGGER {name} ON users')
+    op.execute('DROP FUNCTION bump_users_version()')
+    op.drop_table('table_versions')
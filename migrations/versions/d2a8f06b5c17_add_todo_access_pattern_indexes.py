@@ -0,0 +1,33 @@
+"""add todo access pattern indexes
+
+Revision ID: d2a8f06b5c17
+Revises: b7e3a1c94d20
+Create Date: 2026-10-18 11:41:09.274531
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2a8f06b5c17'
+down_revision: Union[str, Sequence[str], None] = 'b7e3a1c94d20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.create_index('ix_todos_user_id_created_at_id', 'todos', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_todos_user_id_state_created_at_id', 'todos', ['user_id', 'state', 'created_at', 'id'], unique=False, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_todos_user_id_state_created_at_id', table_name='todos', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_todos_user_id_created_at_id', table_name='todos', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,52 @@
+"""add todos updated_at and todos_version
+
+Revision ID: e5c91b7d3f42
+Revises: d2a8f06b5c17
+Create Date: 2026-10-18 14:22:37.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5c91b7d3f42'
+down_revision: Union[str, Sequence[str], None] = 'd2a8f06b5c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TRIGGERS = {'INSERT': 'NEW', 'UPDATE': 'NEW', 'DELETE': 'OLD'}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('todos_version', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('todos', sa.Column('updated_at', sa.DateTime(), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=False))
+    op.execute("""
+        CREATE OR REPLACE FUNCTION bump_todos_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            UPDATE users SET todos_version = todos_version + 1
+            WHERE id IN (SELECT DISTINCT user_id FROM changed_todos);
+            RETURN NULL;
+        END
+        $$
+    """)
+    for operation, transition in TRIGGERS.items():
+        op.execute(
+            f'CREATE TRIGGER todos_version_{operation.lower()} '
+            f'AFTER {operation} ON todos '
+            f'REFERENCING {transition} TABLE AS changed_todos '
+            'FOR EACH STATEMENT EXECUTE FUNCTION bump_todos_version()'
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for operation in TRIGGERS:
+        op.execute(f'DROP TRIGGER todos_version_{operation.lower()} ON todos')
+    op.execute('DROP FUNCTION bump_todos_version()')
+    op.drop_column('todos', 'updated_at')
+    op.drop_column('users', 'todos_version')
@@ -0,0 +1,29 @@
+"""cascade todo deletes from users
+
+Revision ID: f3a7c2e91b08
+Revises: e5c91b7d3f42
+Create Date: 2026-10-18 18:05:12.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a7c2e91b08'
+down_revision: Union[str, Sequence[str], None] = 'e5c91b7d3f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint(op.f('todos_user_id_fkey'), 'todos', type_='foreignkey')
+    op.create_foreign_key(op.f('todos_user_id_fkey'), 'todos', 'users', ['user_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint(op.f('todos_user_id_fkey'), 'todos', type_='foreignkey')
+    op.create_foreign_key(op.f('todos_user_id_fkey'), 'todos', 'users', ['user_id'], ['id'])
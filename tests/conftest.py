@@ -1,54 +1,217 @@
-from contextlib import contextmanager
+import asyncio
+import time
+from contextlib import asynccontextmanager, contextmanager
 from datetime import datetime
+from functools import cache
 
 import factory
 import factory.fuzzy
 import pytest
 import pytest_asyncio
 from fastapi.testclient import TestClient
-from sqlalchemy import event
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from testcontainers.postgres import PostgresContainer
 
+from fastapi_async import database, responses
 from fastapi_async.app import app
-from fastapi_async.database import get_session
+from fastapi_async.database import (
+    build_engine,
+    get_replica_session_factory,
+    get_session,
+    replica_router,
+)
+from fastapi_async.metrics import instrument_engine
 from fastapi_async.models import Todo, TodoState, User, table_registry
-from fastapi_async.security import get_hashed_password
+from fastapi_async.ratelimit import login_rate_limiter
+from fastapi_async.security import (
+    get_hashed_password,
+    get_read_session,
+    principal_cache,
+)
 from fastapi_async.settings import Settings
 
+SAVEPOINT_STATEMENTS = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO')
+
+# Argon2 dominates fixture setup; the same hash verifies for every test.
+_hashed_password = cache(get_hashed_password)
+
 
 @pytest.fixture
 def client(session):
     def _override_get_session():
         return session
 
+    @asynccontextmanager
+    async def _override_replica_session(user_id=None):
+        yield session
+
     app.dependency_overrides[get_session] = _override_get_session
+    app.dependency_overrides[get_replica_session_factory] = lambda: (
+        _override_replica_session
+    )
+    app.dependency_overrides[get_read_session] = _override_get_session
 
     with TestClient(app) as client:
         yield client
 
     app.dependency_overrides.clear()
+    principal_cache.clear()
+    login_rate_limiter.backend.clear()
+
+
+class FakeRedis:
+    # Stores bytes with millisecond expiries, like the redis.asyncio client.
+
+    def __init__(self):
+        self.values = {}
+        self.expires_at = {}
+
+    def _expire(self, name: str):
+        if self.expires_at.get(name, float('inf')) <= time.time():
+            self.values.pop(name, None)
+            self.expires_at.pop(name, None)
+
+    async def get(self, name: str):
+        self._expire(name)
+        return self.values.get(name)
+
+    async def set(self, name: str, value, px: int | None = None):
+        self.values[name] = str(value).encode()
+        self.expires_at.pop(name, None)
+        if px is not None:
+            await self.pexpire(name, px)
+
+    async def incrby(self, name: str, amount: int = 1) -> int:
+        self._expire(name)
+        value = int(self.values.get(name, b'0')) + amount
+        self.values[name] = str(value).encode()
+        return value
+
+    async def pexpire(self, name: str, time_ms: int) -> bool:
+        if name not in self.values:
+            return False
+        self.expires_at[name] = time.time() + time_ms / 1000
+        return True
+
+
+@pytest.fixture
+def app_engine(engine, session, monkeypatch):
+    # Runs the app's real session dependencies against the test database.
+    # They only see committed rows, so tests using it are marked `commits`;
+    # depending on `session` truncates whatever they wrote.
+    engines = []
+
+    def _app_engine(**overrides):
+        app_engine = build_engine(
+            Settings(
+                DATABASE_URL=engine.url.render_as_string(hide_password=False),
+                **overrides,
+            )
+        )
+        monkeypatch.setattr(database, '_engine', app_engine)
+        monkeypatch.setattr(replica_router, 'primary', app_engine)
+        engines.append(app_engine)
+
+        return app_engine
+
+    yield _app_engine
+
+    for app_engine in engines:
+        asyncio.run(app_engine.dispose())
+
+    principal_cache.clear()
+    login_rate_limiter.backend.clear()
+
+
+@pytest.fixture
+def app_client(app_engine):
+    app_engine()
+
+    with TestClient(app) as client:
+        yield client
+
+
+def login_headers(client, user) -> dict[str, str]:
+    token = client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    ).json()['access_token']
+
+    return {'Authorization': f'Bearer {token}'}
+
+
+async def _create_schema(url: str):
+    schema_engine = create_async_engine(url)
+
+    async with schema_engine.begin() as conn:
+        await conn.run_sync(table_registry.metadata.create_all)
+
+    await schema_engine.dispose()
+
+
+async def _restart_sequences(conn):
+    for table in table_registry.metadata.sorted_tables:
+        if 'id' not in table.c:
+            continue
+
+        await conn.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence(:table, 'id'), 1, false)"
+            ),
+            {'table': table.name},
+        )
 
 
 @pytest.fixture(scope='session')
-def engine():
+def engine(request):
+    # pytest-xdist gives each worker an id; without it there is one run.
+    worker_id = getattr(request.config, 'workerinput', {}).get(
+        'workerid', 'master'
+    )
+
     with PostgresContainer(
         'postgres:13.1-alpine',
         driver='psycopg',
+        dbname=f'test_{worker_id}',
     ) as postgres:
-        yield create_async_engine(postgres.get_connection_url())
+        url = postgres.get_connection_url()
+        asyncio.run(_create_schema(url))
+
+        yield instrument_engine(create_async_engine(url))
 
 
 @pytest_asyncio.fixture
-async def session(engine):
-    async with engine.begin() as conn:
-        await conn.run_sync(table_registry.metadata.create_all)
+async def session(engine, request):
+    # Tests marked `commits` talk to the database from other connections,
+    # so they need real commits and a TRUNCATE afterwards.
+    if request.node.get_closest_marker('commits'):
+        async with engine.begin() as conn:
+            await _restart_sequences(conn)
 
-    async with AsyncSession(engine, expire_on_commit=False) as session:
-        yield session
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
 
-    async with engine.begin() as conn:
-        await conn.run_sync(table_registry.metadata.drop_all)
+        tables = ', '.join(
+            table.name for table in table_registry.metadata.sorted_tables
+        )
+        async with engine.begin() as conn:
+            await conn.execute(text(f'TRUNCATE {tables} CASCADE'))
+
+        return
+
+    async with engine.connect() as conn:
+        transaction = await conn.begin()
+        await _restart_sequences(conn)
+
+        async with AsyncSession(
+            bind=conn,
+            expire_on_commit=False,
+            join_transaction_mode='create_savepoint',
+        ) as session:
+            yield session
+
+        await transaction.rollback()
 
 
 @contextmanager
@@ -69,11 +232,52 @@ def mock_db_time():
     return _mock_db_time
 
 
+@contextmanager
+def _count_queries(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, *args):
+        # Savepoints come from the rollback-per-test session, not the app.
+        if not statement.startswith(SAVEPOINT_STATEMENTS):
+            statements.append((statement, parameters))
+
+    event.listen(
+        engine.sync_engine, 'before_cursor_execute', before_cursor_execute
+    )
+
+    yield statements
+
+    event.remove(
+        engine.sync_engine, 'before_cursor_execute', before_cursor_execute
+    )
+
+
+@pytest.fixture
+def count_queries():
+    return _count_queries
+
+
+@contextmanager
+def _assert_max_queries(engine, max_queries: int):
+    with _count_queries(engine) as statements:
+        yield statements
+
+    assert len(statements) <= max_queries, (
+        f'{len(statements)} queries, budget is {max_queries}:\n'
+        + '\n'.join(statement for statement, _ in statements)
+    )
+
+
+@pytest.fixture
+def assert_max_queries():
+    return _assert_max_queries
+
+
 @pytest_asyncio.fixture
 async def user(session: AsyncSession):
     password = 'securepassword123'
 
-    user = UserFactory(password=get_hashed_password(password))
+    user = UserFactory(password=_hashed_password(password))
 
     session.add(user)
     await session.commit()
@@ -88,7 +292,7 @@ async def user(session: AsyncSession):
 async def another_user(session: AsyncSession):
     password = 'anothersecurepassword123'
 
-    user = UserFactory(password=get_hashed_password(password))
+    user = UserFactory(password=_hashed_password(password))
 
     session.add(user)
     await session.commit()
@@ -117,6 +321,11 @@ def settings():
     return Settings()
 
 
+@pytest.fixture
+def fast_json_responses(monkeypatch):
+    monkeypatch.setattr(responses.settings, 'FAST_JSON_RESPONSES', True)
+
+
 class UserFactory(factory.Factory):
     class Meta:
         model = User
@@ -1,8 +1,223 @@
+import asyncio
+import json
 from http import HTTPStatus
 
+import pytest
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from fastapi_async import metrics
+from fastapi_async.admission import AdmissionMiddleware, ConcurrencyLimiter
+from fastapi_async.compression import COMPRESSORS, negotiate
+from fastapi_async.metrics import MetricsMiddleware
+from tests.conftest import TodoFactory
+
 
 def test_read_root_should_return_hello_world(client):
     response = client.get('/')
 
     assert response.status_code == HTTPStatus.OK
     assert response.json() == {'message': 'Hello, World!'}
+
+
+def test_fast_json_routes_should_keep_openapi_response_models(client):
+    schema = client.get('/openapi.json').json()
+
+    list_todos = schema['paths']['/todos/']['get']['responses']['200']
+    assert list_todos['content']['application/json']['schema'] == {
+        '$ref': '#/components/schemas/TodoListSchema'
+    }
+
+
+@pytest.mark.parametrize(
+    ('accept_encoding', 'expected'),
+    [
+        ('gzip, deflate, br, zstd', 'zstd'),
+        ('gzip;q=1, br;q=0.5', 'gzip'),
+        ('br, zstd;q=0', 'br'),
+        ('*', 'zstd'),
+        ('*, zstd;q=0, br;q=0', 'gzip'),
+        ('identity', None),
+        ('gzip;q=bogus', None),
+    ],
+)
+def test_negotiate_should_pick_best_accepted_encoding(
+    accept_encoding, expected
+):
+    assert negotiate(accept_encoding, ('zstd', 'br', 'gzip')) == expected
+
+
+@pytest.mark.parametrize(
+    'encoding',
+    [
+        pytest.param(
+            encoding,
+            marks=pytest.mark.skipif(
+                encoding not in COMPRESSORS,
+                reason=f'{encoding} needs the compression extra',
+            ),
+        )
+        for encoding in ('gzip', 'br', 'zstd')
+    ],
+)
+@pytest.mark.asyncio
+async def test_large_json_responses_should_be_compressed(
+    client, token, session, user, encoding
+):
+    todo_count = 50
+    session.add_all(TodoFactory.create_batch(todo_count, user_id=user.id))
+    await session.commit()
+
+    response = client.get(
+        f'/todos/?limit={todo_count}',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Accept-Encoding': encoding,
+        },
+    )
+
+    assert response.headers['content-encoding'] == encoding
+    assert response.headers['vary'] == 'Accept-Encoding'
+    assert int(response.headers['content-length']) < len(response.content)
+    assert len(response.json()['todos']) == todo_count
+
+
+def test_small_responses_should_not_be_compressed(client):
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'content-encoding' not in response.headers
+    assert response.json() == {'message': 'Hello, World!'}
+
+
+@pytest.mark.asyncio
+async def test_streaming_export_should_be_compressed(
+    client, token, session, user
+):
+    todos = TodoFactory.create_batch(3, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    response = client.get(
+        '/todos/export',
+        headers={
+            'Authorization': f'Bearer {token}',
+            'Accept-Encoding': 'gzip',
+        },
+    )
+
+    assert response.headers['content-encoding'] == 'gzip'
+    assert 'content-length' not in response.headers
+    assert [json.loads(line)['id'] for line in response.text.splitlines()] == [
+        todo.id for todo in todos
+    ]
+
+
+def _sample(exposition: str, series: str) -> float:
+    for line in exposition.splitlines():
+        name, _, value = line.rpartition(' ')
+        if name == series:
+            return float(value)
+
+    return 0
+
+
+def test_metrics_should_expose_route_and_database_timings(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    before = client.get('/metrics').text
+
+    client.get('/todos/', headers=headers)
+    response = client.get('/metrics')
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/plain')
+    requests = (
+        'http_request_duration_seconds_count'
+        '{method="GET",route="/todos/",status="200"}'
+    )
+    queries = 'db_queries_per_request_sum{route="/todos/"}'
+    assert _sample(response.text, requests) == _sample(before, requests) + 1
+    assert _sample(response.text, queries) > _sample(before, queries)
+    assert 'http_requests_in_flight 1' in response.text
+    assert 'db_pool_size{engine="primary"}' in response.text
+    assert _sample(
+        response.text,
+        'password_hash_duration_seconds_count{operation="verify_password"}',
+    )
+
+
+@pytest.mark.asyncio
+async def test_requests_over_query_budget_should_be_logged(session, caplog):
+    # Open the test's savepoint up front so it isn't counted below.
+    await session.connection()
+
+    async def two_queries(scope, receive, send):
+        await session.execute(select(1))
+        await session.execute(select(2))
+        await PlainTextResponse('ok')(scope, receive, send)
+
+    budgeted = TestClient(MetricsMiddleware(two_queries, query_budget=1))
+    budgeted.get('/over-budget')
+
+    assert 'GET unmatched ran 2 queries, over the budget of 1' in caplog.text
+    assert 'SELECT 1\nSELECT 2' in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_limiter_should_hand_released_slots_to_waiters():
+    limiter = ConcurrencyLimiter(1, max_queue=1, queue_timeout=1)
+
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+    waiter = asyncio.create_task(limiter.wait())
+    await asyncio.sleep(0)
+    limiter.release()
+
+    assert await waiter
+    assert (limiter.active, limiter.queued) == (1, 0)
+
+
+@pytest.mark.asyncio
+async def test_limiter_should_give_up_after_queue_timeout():
+    limiter = ConcurrencyLimiter(1, max_queue=1, queue_timeout=0.01)
+    limiter.try_acquire()
+
+    assert not await limiter.wait()
+    assert (limiter.active, limiter.queued) == (1, 0)
+
+
+def test_limiter_should_adapt_limit_to_latency():
+    limiter = ConcurrencyLimiter(10, 1, 1, target_latency=0.1)
+    decreased_limit = 9
+
+    limiter.observe(1)
+    assert limiter.limit == decreased_limit
+
+    for _ in range(decreased_limit):
+        limiter.observe(0.01)
+    assert limiter.limit == limiter.max_limit
+
+
+def test_full_queue_should_be_shed_with_retry_after(client, monkeypatch):
+    # The middleware below registers its own collector; keep it out of the
+    # app's /metrics once the test is done.
+    monkeypatch.setattr(metrics, '_collectors', list(metrics._collectors))
+    limiter = ConcurrencyLimiter(1, max_queue=0, queue_timeout=1)
+    limiter.try_acquire()
+    shedding = TestClient(
+        AdmissionMiddleware(
+            PlainTextResponse('ok'), {'reads': limiter}, retry_after=3
+        )
+    )
+
+    response = shedding.get('/todos/')
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['retry-after'] == '3'
+    assert _sample(
+        client.get('/metrics').text,
+        'admission_rejected_requests_total'
+        '{route_class="reads",reason="queue_full"}',
+    )
+    assert shedding.post('/todos/').status_code == HTTPStatus.OK
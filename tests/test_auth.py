@@ -3,6 +3,15 @@ from http import HTTPStatus
 import pytest
 from freezegun import freeze_time
 
+from fastapi_async.ratelimit import (
+    LoginRateLimiter,
+    ShardedMemoryBackend,
+    SlidingWindow,
+    TokenBucket,
+    login_rate_limiter,
+)
+from tests.conftest import FakeRedis
+
 
 @pytest.mark.asyncio
 async def test_get_token_should_return_access_token(client, user):
@@ -141,3 +150,108 @@ def test_refresh_token_expired_dont_refresh(client, user):
         assert response.status_code == HTTPStatus.UNAUTHORIZED
         response_data = response.json()
         assert response_data['detail'] == 'Token has expired'
+
+
+@pytest.fixture(params=['memory', 'redis'])
+def rate_limit_backend(request):
+    if request.param == 'memory':
+        return ShardedMemoryBackend(shards=4, max_keys=100)
+
+    return FakeRedis()
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_should_allow_burst_then_refill(
+    rate_limit_backend,
+):
+    bucket = TokenBucket(rate_limit_backend, rate=0.5, burst=2)
+
+    with freeze_time('2026-01-01 12:00:00') as frozen:
+        assert await bucket.hit('ip') == 0
+        assert await bucket.hit('ip') == 0
+        assert await bucket.hit('ip') == pytest.approx(2)
+
+        frozen.tick(2)
+        assert await bucket.hit('ip') == 0
+        assert await bucket.hit('ip') > 0
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_should_weigh_previous_window(
+    rate_limit_backend,
+):
+    window = SlidingWindow(rate_limit_backend, limit=2, window_seconds=60)
+
+    with freeze_time('2026-01-01 12:00:00') as frozen:
+        assert await window.hit('user') == 0
+        assert await window.hit('user') == 0
+        assert await window.hit('user') == pytest.approx(60)
+
+        # Half of the previous window still counts: 2 * 0.5 = 1 attempt.
+        frozen.tick(90)
+        assert await window.hit('user') == 0
+        assert await window.hit('user') > 0
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_should_evict_least_recently_used_keys():
+    max_keys = 8
+    backend = ShardedMemoryBackend(shards=2, max_keys=max_keys)
+
+    for n in range(100):
+        await backend.incrby(f'key{n}', 1)
+
+    assert len(backend) <= max_keys
+    assert await backend.get('key99') == '1'
+    assert await backend.get('key0') is None
+
+
+def test_login_should_be_rate_limited_before_database_work(
+    client, user, session, count_queries
+):
+    payload = {'username': user.username, 'password': 'wrongpassword'}
+    attempts = login_rate_limiter.by_username.limit
+
+    # Frozen so the attempts can't straddle two username windows.
+    with freeze_time('2026-01-01 12:00:00'):
+        for _ in range(attempts):
+            client.post('/auth/token', data=payload)
+
+        with count_queries(session.bind) as statements:
+            response = client.post('/auth/token', data=payload)
+
+    assert response.status_code == HTTPStatus.TOO_MANY_REQUESTS
+    assert int(response.headers['retry-after']) > 0
+    assert statements == []
+
+    other = client.post(
+        '/auth/token', data={'username': 'other', 'password': 'x'}
+    )
+    assert other.status_code == HTTPStatus.UNAUTHORIZED
+
+
+def test_successful_logins_should_not_count_against_username(client, user):
+    payload = {'username': user.username, 'password': user.clean_password}
+    attempts = login_rate_limiter.by_username.limit
+
+    responses = [
+        client.post('/auth/token', data=payload) for _ in range(attempts + 1)
+    ]
+
+    assert {response.status_code for response in responses} == {HTTPStatus.OK}
+
+
+@pytest.mark.asyncio
+async def test_disabled_login_limiter_should_allow_every_attempt(
+    rate_limit_backend,
+):
+    limiter = LoginRateLimiter(
+        rate_limit_backend,
+        TokenBucket(rate_limit_backend, rate=0.5, burst=1),
+        SlidingWindow(rate_limit_backend, limit=1, window_seconds=60),
+        enabled=False,
+    )
+
+    for _ in range(3):
+        await limiter.record_failure('user')
+        assert await limiter.retry_after('user', '127.0.0.1') == 0
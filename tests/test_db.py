@@ -1,8 +1,48 @@
+import asyncio
+import time
+from datetime import datetime
+from http import HTTPStatus
+from typing import Annotated
+
+import psycopg
 import pytest
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi import Depends, FastAPI, Request
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload
+from sqlalchemy.pool import NullPool
 
+from fastapi_async import deadlines
+from fastapi_async.app import handle_query_canceled
+from fastapi_async.database import (
+    ReplicaRouter,
+    build_engine,
+    get_pool_stats,
+    replica_router,
+)
+from fastapi_async.deadlines import (
+    CancelOnDisconnectMiddleware,
+    apply_deadline,
+)
+from fastapi_async.metrics import render
 from fastapi_async.models import User
+from fastapi_async.pagination import encode_cursor
+from fastapi_async.settings import Settings
+from tests.conftest import TodoFactory, login_headers
+
+SLOW_QUERY_SECONDS = 5
+REQUEST_DEADLINE_MS = 1_000
+QUEUED_SECONDS = 0.5
+EXPLAINED_VERBS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+# What the todos_user_id_fkey ON DELETE CASCADE trigger runs per user.
+CASCADE_TODOS = 'DELETE FROM ONLY todos WHERE user_id = %(user_id)s'
+ACTIVE_SLEEPS = text(
+    "SELECT count(*) FROM pg_stat_activity WHERE state = 'active' "
+    "AND query LIKE 'SELECT pg_sleep%'"
+)
 
 
 @pytest.mark.asyncio
@@ -17,7 +57,11 @@ async def test_create_user(session: AsyncSession, mock_db_time):
         session.add(new_user)
         await session.commit()
 
-    user = await session.scalar(select(User).where(User.username == 'test'))
+    user = await session.scalar(
+        select(User)
+        .options(selectinload(User.todos))
+        .where(User.username == 'test')
+    )
 
     assert user is not None
     assert user.id == 1
@@ -25,3 +69,431 @@ async def test_create_user(session: AsyncSession, mock_db_time):
     assert user.email == 'test@test.com'
     assert user.created_at == time
     assert user.todos == []
+
+
+def _unindexed_scans(plan):
+    scans = []
+
+    if plan['Node Type'] == 'Seq Scan' or (
+        plan['Node Type'] in {'Index Scan', 'Index Only Scan'}
+        and 'Index Cond' not in plan
+        and 'Filter' in plan
+    ):
+        scans.append(plan['Relation Name'])
+
+    for child in plan.get('Plans', []):
+        scans.extend(_unindexed_scans(child))
+
+    return scans
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'route',
+    [
+        ('get', '/todos/'),
+        ('get', '/todos/?state=todo'),
+        ('get', '/todos/?title=Title'),
+        (
+            'get',
+            f'/todos/?cursor={encode_cursor(datetime(2026, 1, 1), 1)}',
+        ),
+        ('patch', '/todos/1'),
+        ('delete', '/todos/1'),
+        ('get', '/users/'),
+        ('delete', '/users/1'),
+    ],
+)
+async def test_route_queries_should_use_indexes(
+    client, session, user, count_queries, route
+):
+    method, url = route
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = login_headers(client, user)
+
+    with count_queries(session.bind) as statements:
+        client.request(
+            method,
+            url,
+            json={'state': 'done'} if method == 'patch' else None,
+            headers=headers,
+        )
+
+    assert statements
+    if (method, url) == ('delete', '/users/1'):
+        statements.append((CASCADE_TODOS, {'user_id': user.id}))
+
+    connection = await session.connection()
+    await connection.exec_driver_sql('SET enable_seqscan = off')
+
+    for statement, parameters in statements:
+        if not statement.startswith(EXPLAINED_VERBS):
+            continue
+
+        result = await connection.exec_driver_sql(
+            f'EXPLAIN (FORMAT JSON) {statement}', parameters
+        )
+        plan = result.scalar()[0]['Plan']
+
+        assert _unindexed_scans(plan) == [], statement
+
+
+def test_null_pool_setting_should_disable_pooling():
+    engine = build_engine(Settings(DATABASE_NULL_POOL=True))
+
+    assert isinstance(engine.pool, NullPool)
+    assert get_pool_stats(engine) == {}
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_should_record_checkouts_and_timeouts(engine):
+    pool_timeout = 0.1
+    pooled_engine = build_engine(
+        Settings(
+            DATABASE_URL=engine.url.render_as_string(hide_password=False),
+            DATABASE_POOL_SIZE=1,
+            DATABASE_MAX_OVERFLOW=0,
+            DATABASE_POOL_TIMEOUT=pool_timeout,
+        )
+    )
+
+    async with pooled_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            await pooled_engine.connect()
+
+    stats = get_pool_stats(pooled_engine)
+    await pooled_engine.dispose()
+
+    assert stats['size'] == 1
+    assert stats['checkouts'] == 1
+    assert stats['timeouts'] == 1
+    assert stats['wait_seconds_max'] >= pool_timeout
+
+
+@pytest.mark.asyncio
+async def test_pool_wait_should_exclude_connection_setup(engine, monkeypatch):
+    connect_seconds = 0.2
+    pooled_engine = build_engine(
+        Settings(DATABASE_URL=engine.url.render_as_string(hide_password=False))
+    )
+    event.listen(
+        pooled_engine.sync_engine,
+        'connect',
+        lambda *args: time.sleep(connect_seconds),
+    )
+    monkeypatch.setattr(replica_router, 'primary', pooled_engine)
+
+    async with pooled_engine.connect():
+        pass
+
+    stats = get_pool_stats(pooled_engine)
+    render()
+    scraped_stats = get_pool_stats(pooled_engine)
+    await pooled_engine.dispose()
+
+    assert stats['checkouts'] == 1
+    assert stats['wait_seconds_max'] < connect_seconds
+    assert scraped_stats['wait_seconds_max'] == 0
+
+
+def _replica_router(replicas, read_your_writes_seconds=5):
+    return ReplicaRouter(
+        primary='primary',
+        replicas=replicas,
+        eject_seconds=30,
+        read_your_writes_seconds=read_your_writes_seconds,
+    )
+
+
+def test_replica_router_should_round_robin_reads():
+    router = _replica_router(['replica-1', 'replica-2'])
+
+    engines = [router.engine_for(user_id=1) for _ in range(4)]
+
+    assert engines == ['replica-1', 'replica-2', 'replica-1', 'replica-2']
+
+
+def test_replica_router_without_replicas_should_use_primary():
+    router = _replica_router([])
+
+    assert router.engine_for(user_id=1) == 'primary'
+
+
+def test_replica_router_should_read_your_writes_from_primary():
+    router = _replica_router(['replica'])
+
+    router.record_write(1)
+
+    assert router.engine_for(user_id=1) == 'primary'
+    assert router.engine_for(user_id=2) == 'replica'
+
+
+def test_replica_router_read_your_writes_window_should_expire():
+    router = _replica_router(['replica'], read_your_writes_seconds=0)
+
+    router.record_write(1)
+
+    assert router.engine_for(user_id=1) == 'replica'
+
+
+def test_replica_router_should_skip_ejected_replicas():
+    router = _replica_router(['replica-1', 'replica-2'])
+
+    router.eject('replica-1')
+
+    assert {router.engine_for() for _ in range(4)} == {'replica-2'}
+
+    router.eject('replica-2')
+
+    assert router.engine_for() == 'primary'
+
+
+@pytest.mark.asyncio
+async def test_replica_router_should_eject_unreachable_replica(engine):
+    unreachable = build_engine(
+        Settings(DATABASE_URL='postgresql+psycopg://nobody@127.0.0.1:1/db')
+    )
+    router = ReplicaRouter(
+        primary=engine,
+        replicas=[unreachable],
+        eject_seconds=30,
+        read_your_writes_seconds=5,
+    )
+
+    with pytest.raises(OperationalError):
+        async with router.session() as session:
+            await session.execute(select(1))
+
+    assert router.engine_for() is engine
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('prepare_threshold', 'expected_prepared'), [(1, 1), (None, 0)]
+)
+async def test_prepare_threshold_should_control_server_side_prepares(
+    engine, prepare_threshold, expected_prepared
+):
+    prepared_engine = build_engine(
+        Settings(
+            DATABASE_URL=engine.url.render_as_string(hide_password=False),
+            DATABASE_PREPARE_THRESHOLD=prepare_threshold,
+        )
+    )
+
+    async with prepared_engine.connect() as connection:
+        for user_id in range(3):
+            await connection.execute(
+                select(func.count()).where(User.id == user_id)
+            )
+        prepared = await connection.scalar(
+            text('SELECT count(*) FROM pg_prepared_statements')
+        )
+
+    await prepared_engine.dispose()
+
+    assert prepared == expected_prepared
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_slow_queries_should_be_logged_with_their_plan(
+    engine, session, user, caplog
+):
+    slow_engine = build_engine(
+        Settings(
+            DATABASE_URL=engine.url.render_as_string(hide_password=False),
+            DATABASE_SLOW_QUERY_MS=0,
+            DATABASE_EXPLAIN_SLOW_QUERIES=True,
+        )
+    )
+
+    async with slow_engine.connect() as connection:
+        username = await connection.scalar(
+            select(User.username).where(User.id == user.id)
+        )
+
+    await slow_engine.dispose()
+
+    assert username == user.username
+    assert 'Slow query' in caplog.text
+    assert 'FROM users' in caplog.text
+    assert 'Index Scan using users_pkey' in caplog.text
+
+
+def test_route_deadline_should_cancel_slow_query_with_504(engine, monkeypatch):
+    monkeypatch.setattr(
+        deadlines.settings, 'ROUTE_DEADLINES_MS', {'GET /slow': 50}
+    )
+    slow_engine = create_async_engine(engine.url, poolclass=NullPool)
+    slow_app = FastAPI(
+        exception_handlers={OperationalError: handle_query_canceled}
+    )
+
+    async def deadline_session(request: Request):
+        async with AsyncSession(slow_engine) as session:
+            apply_deadline(session, request)
+            yield session
+
+    @slow_app.get('/slow')
+    async def slow(
+        session: Annotated[AsyncSession, Depends(deadline_session)],
+    ):
+        await session.execute(text(f'SELECT pg_sleep({SLOW_QUERY_SECONDS})'))
+
+    start = time.perf_counter()
+    response = TestClient(slow_app).get('/slow')
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert response.json() == {'detail': 'Request deadline exceeded'}
+    assert time.perf_counter() - start < SLOW_QUERY_SECONDS
+
+
+@pytest.mark.commits
+def test_app_deadline_should_cancel_blocked_query_with_504(
+    app_client, user, count_queries, monkeypatch
+):
+    monkeypatch.setattr(
+        deadlines.settings,
+        'ROUTE_DEADLINES_MS',
+        {'GET /todos/': REQUEST_DEADLINE_MS},
+    )
+    headers = login_headers(app_client, user)
+    locker_url = replica_router.primary.url.set(drivername='postgresql')
+
+    with (
+        psycopg.connect(
+            locker_url.render_as_string(hide_password=False)
+        ) as locker,
+        count_queries(replica_router.primary) as statements,
+    ):
+        # Holds the list query until its statement_timeout cancels it.
+        locker.execute('LOCK TABLE todos IN ACCESS EXCLUSIVE MODE')
+        response = app_client.get('/todos/', headers=headers)
+
+    assert response.status_code == HTTPStatus.GATEWAY_TIMEOUT
+    assert response.json() == {'detail': 'Request deadline exceeded'}
+    timeouts = [
+        int(statement.split()[-1])
+        for statement, _ in statements
+        if statement.startswith('SET LOCAL statement_timeout')
+    ]
+    assert timeouts
+    assert max(timeouts) <= REQUEST_DEADLINE_MS
+
+
+@pytest.mark.asyncio
+async def test_deadline_should_start_when_request_arrives(engine, monkeypatch):
+    monkeypatch.setattr(
+        deadlines.settings, 'REQUEST_DEADLINE_MS', REQUEST_DEADLINE_MS
+    )
+    timeouts = []
+
+    async def queued_app(scope, receive, send):
+        await asyncio.sleep(QUEUED_SECONDS)
+        async with AsyncSession(engine) as session:
+            apply_deadline(session, Request(scope))
+            timeouts.append(
+                await session.scalar(text('SHOW statement_timeout'))
+            )
+            await session.rollback()
+
+    requests = [{'type': 'http.request', 'body': b''}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+
+        await asyncio.Event().wait()
+
+    async def send(message):
+        pass
+
+    await CancelOnDisconnectMiddleware(queued_app)(
+        {'type': 'http', 'method': 'GET', 'path': '/'}, receive, send
+    )
+
+    remaining_ms = REQUEST_DEADLINE_MS - QUEUED_SECONDS * 1000
+    assert int(timeouts[0].removesuffix('ms')) <= remaining_ms
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_should_cancel_running_query(engine):
+    slow_engine = create_async_engine(engine.url, poolclass=NullPool)
+    query_started = asyncio.Event()
+    sent = []
+
+    async def slow_app(scope, receive, send):
+        async with AsyncSession(slow_engine) as session:
+            await session.connection()
+            query_started.set()
+            await session.execute(
+                text(f'SELECT pg_sleep({SLOW_QUERY_SECONDS})')
+            )
+
+    requests = [{'type': 'http.request', 'body': b''}]
+
+    async def receive():
+        if requests:
+            return requests.pop()
+
+        await query_started.wait()
+        await asyncio.sleep(0.1)
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    start = time.perf_counter()
+    await CancelOnDisconnectMiddleware(slow_app)(
+        {'type': 'http', 'method': 'GET', 'path': '/slow'}, receive, send
+    )
+
+    assert time.perf_counter() - start < SLOW_QUERY_SECONDS
+    assert sent == []
+    async with engine.connect() as conn:
+        assert await conn.scalar(ACTIVE_SLEEPS) == 0
+
+
+@pytest.mark.asyncio
+async def test_cancel_on_disconnect_should_not_read_ahead_of_app():
+    reads = []
+
+    async def idle_app(scope, receive, send):
+        await asyncio.sleep(0.1)
+
+    async def receive():
+        reads.append(len(reads))
+        return {'type': 'http.request', 'body': b'chunk', 'more_body': True}
+
+    async def send(message):
+        pass
+
+    await CancelOnDisconnectMiddleware(idle_app)(
+        {'type': 'http', 'method': 'POST', 'path': '/'}, receive, send
+    )
+
+    # One chunk waits in the queue and the next waits for room in it.
+    assert reads == [0, 1]
+
+
+@pytest.mark.asyncio
+async def test_replica_router_should_not_eject_replica_on_timeout(engine):
+    replica = create_async_engine(
+        engine.url,
+        poolclass=NullPool,
+        connect_args={'options': '-c statement_timeout=10'},
+    )
+    router = ReplicaRouter(
+        primary=engine,
+        replicas=[replica],
+        eject_seconds=30,
+        read_your_writes_seconds=5,
+    )
+
+    with pytest.raises(OperationalError):
+        async with router.session() as session:
+            await session.execute(text('SELECT pg_sleep(1)'))
+
+    assert router.engine_for() is replica
@@ -1,9 +1,24 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from http import HTTPStatus
+from threading import BoundedSemaphore
 
+import pytest
+from fastapi.testclient import TestClient
+from freezegun import freeze_time
 from jwt import decode, encode
 
-from fastapi_async.security import create_access_token
+from fastapi_async import security
+from fastapi_async.app import app
+from fastapi_async.database import build_engine, replica_router
+from fastapi_async.security import (
+    create_access_token,
+    get_hashed_password_async,
+    principal_cache,
+    verify_password_async,
+)
+from fastapi_async.settings import Settings
+from tests.conftest import login_headers
 
 
 def test_jwt(settings):
@@ -50,3 +65,155 @@ def test_jwt_expired_token(client, settings):
 
     assert response.status_code == HTTPStatus.UNAUTHORIZED
     assert response.json() == {'detail': 'Token has expired'}
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_password_async():
+    hashed = await get_hashed_password_async('secret')
+
+    assert await verify_password_async('secret', hashed)
+    assert not await verify_password_async('wrong', hashed)
+
+
+def test_saturated_hash_executor_should_return_503(client, user, monkeypatch):
+    monkeypatch.setattr(security, '_hash_slots', BoundedSemaphore(1))
+    security._hash_slots.acquire()
+
+    response = client.post(
+        '/auth/token',
+        data={'username': user.username, 'password': user.clean_password},
+    )
+
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.headers['Retry-After'] == '1'
+    assert response.json() == {'detail': 'Server is busy, try again later'}
+
+
+def test_principal_cache_should_hit_on_reused_token(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+
+    client.get('/todos/', headers=headers)
+    client.get('/todos/', headers=headers)
+
+    assert principal_cache.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+    exposition = client.get('/metrics').text
+    assert 'principal_cache_entries 1' in exposition
+    assert 'principal_cache_hits_total 1' in exposition
+    assert 'principal_cache_misses_total 1' in exposition
+
+
+def test_update_user_should_invalidate_cached_principal(client, user, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    client.get('/todos/', headers=headers)
+
+    client.put(
+        f'/users/{user.id}',
+        headers=headers,
+        json={
+            'username': 'renamed',
+            'email': 'renamed@email.com',
+            'password': 'securepassword123',
+        },
+    )
+    response = client.get('/todos/', headers=headers)
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+def test_cached_principal_should_expire_with_token(client, user):
+    with freeze_time('2026-01-01 12:00:00'):
+        response = client.post(
+            '/auth/token',
+            data={'username': user.username, 'password': user.clean_password},
+        )
+        headers = {
+            'Authorization': f'Bearer {response.json()["access_token"]}'
+        }
+        client.get('/todos/', headers=headers)
+
+    with freeze_time('2026-01-01 13:01:00'):
+        response = client.get('/todos/', headers=headers)
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Token has expired'}
+
+
+def test_access_token_should_carry_user_id_and_version(
+    client, user, token, settings
+):
+    decoded = decode(
+        token,
+        settings.SECRET_KEY,
+        algorithms=[settings.ALGORITHM],
+    )
+
+    assert decoded['uid'] == user.id
+    assert decoded['ver'] == user.token_version
+
+
+def test_legacy_token_without_user_id_should_authenticate(client, user):
+    legacy_token = create_access_token({'sub': user.username})
+
+    response = client.get(
+        '/todos/',
+        headers={'Authorization': f'Bearer {legacy_token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+
+
+def test_token_with_stale_version_should_return_401(client, user):
+    stale_token = create_access_token({
+        'sub': user.username,
+        'uid': user.id,
+        'ver': user.token_version - 1,
+    })
+
+    response = client.get(
+        '/todos/',
+        headers={'Authorization': f'Bearer {stale_token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNAUTHORIZED
+    assert response.json() == {'detail': 'Could not validate credentials'}
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_auth_lookup_should_release_its_connection_before_route(
+    app_engine, user
+):
+    app_engine(
+        DATABASE_POOL_SIZE=1, DATABASE_MAX_OVERFLOW=0, DATABASE_POOL_TIMEOUT=1
+    )
+
+    with TestClient(app) as client:
+        response = client.post(
+            '/todos/',
+            json={'title': 'One'},
+            headers=login_headers(client, user),
+        )
+
+    assert response.status_code == HTTPStatus.CREATED
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_auth_lookup_should_read_recent_writes_from_primary(
+    app_engine, user, monkeypatch
+):
+    app_engine()
+    lagging_replica = build_engine(
+        Settings(DATABASE_URL='postgresql+psycopg://nobody@127.0.0.1:1/db')
+    )
+    monkeypatch.setattr(replica_router, 'replicas', [lagging_replica])
+    monkeypatch.setattr(replica_router, '_recent_writes', OrderedDict())
+    replica_router.record_write(user.id)
+
+    with TestClient(app) as client:
+        response = client.post(
+            '/auth/refresh-token', headers=login_headers(client, user)
+        )
+
+    assert response.status_code == HTTPStatus.OK
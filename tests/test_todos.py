@@ -1,8 +1,22 @@
+import asyncio
+import csv
+import io
+import json
+import tracemalloc
 from http import HTTPStatus
 
 import pytest
+from sqlalchemy import select, text
 
-from tests.conftest import TodoFactory
+from fastapi_async import responses
+from fastapi_async.app import app
+from fastapi_async.database import replica_router
+from fastapi_async.models import Todo
+from fastapi_async.todo_import import IMPORT_MAX_RECORD_CHARS
+from fastapi_async.todo_import import main as import_main
+from tests.conftest import TodoFactory, login_headers
+
+EXPORT_ROWS = 200_000
 
 
 def test_create_todo(client, token):
@@ -116,6 +130,69 @@ async def test_list_todos_with_description_filter(
     )
 
 
+@pytest.mark.asyncio
+async def test_list_todos_with_ignore_case_title_filter(
+    client, token, session, user
+):
+    session.add_all([
+        TodoFactory(title='Buy MILK today', user_id=user.id),
+        TodoFactory(title='Walk the dog', user_id=user.id),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/todos/?title=milk&ignore_case=true',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert [todo['title'] for todo in data['todos']] == ['Buy MILK today']
+
+
+@pytest.mark.asyncio
+async def test_list_todos_title_filter_should_escape_wildcards(
+    client, token, session, user
+):
+    session.add_all([
+        TodoFactory(title='100% done', user_id=user.id),
+        TodoFactory(title='1000 done', user_id=user.id),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/todos/',
+        params={'title': '100%'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    data = response.json()
+    assert [todo['title'] for todo in data['todos']] == ['100% done']
+
+
+@pytest.mark.asyncio
+async def test_list_todos_with_rank_should_order_by_relevance(
+    client, token, session, user
+):
+    session.add_all([
+        TodoFactory(
+            title='report draft for the quarterly review', user_id=user.id
+        ),
+        TodoFactory(title='report', user_id=user.id),
+    ])
+    await session.commit()
+
+    response = client.get(
+        '/todos/?title=report&rank=true',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert data['todos'][0]['title'] == 'report'
+    assert data['next_cursor'] is None
+
+
 @pytest.mark.asyncio
 async def test_list_todos_pagination_should_return_2_todos(
     client, token, session, user
@@ -135,6 +212,286 @@ async def test_list_todos_pagination_should_return_2_todos(
     assert len(data['todos']) == expected_todos
 
 
+@pytest.mark.asyncio
+async def test_list_todos_cursor_pagination_should_walk_all_todos(
+    client, token, session, user
+):
+    todos = TodoFactory.create_batch(5, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    seen_ids = []
+    params = {'limit': 2}
+    while True:
+        response = client.get(
+            '/todos/',
+            params=params,
+            headers={'Authorization': f'Bearer {token}'},
+        )
+        assert response.status_code == HTTPStatus.OK
+        data = response.json()
+        seen_ids.extend(todo['id'] for todo in data['todos'])
+
+        if data['next_cursor'] is None:
+            break
+        params['cursor'] = data['next_cursor']
+
+    assert seen_ids == sorted(todo.id for todo in todos)
+
+
+def test_list_todos_with_invalid_cursor_should_return_400(client, token):
+    response = client.get(
+        '/todos/?cursor=not-a-cursor',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {'detail': 'Invalid cursor'}
+
+
+@pytest.mark.asyncio
+async def test_export_todos_as_ndjson(
+    client, token, session, user, another_user
+):
+    todos = TodoFactory.create_batch(3, user_id=user.id)
+    session.add_all([*todos, TodoFactory(user_id=another_user.id)])
+    await session.commit()
+
+    response = client.get(
+        '/todos/export',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'] == 'application/x-ndjson'
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert exported == [
+        {
+            'id': todo.id,
+            'title': todo.title,
+            'description': todo.description,
+            'state': todo.state,
+        }
+        for todo in todos
+    ]
+
+
+@pytest.mark.asyncio
+async def test_export_todos_as_csv(client, token, session, user):
+    todos = TodoFactory.create_batch(2, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+
+    response = client.get(
+        '/todos/export?format=csv',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['content-type'].startswith('text/csv')
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row['id'] for row in rows] == [str(todo.id) for todo in todos]
+    assert rows[0]['title'] == todos[0].title
+
+
+async def _drain(scope) -> int:
+    # Calls the app directly and discards each chunk as it arrives; the
+    # test clients would buffer the whole body.
+    received = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await asyncio.Event().wait()
+        request_sent = True
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal received
+        received += len(message.get('body', b''))
+
+    await app(scope, receive, send)
+
+    return received
+
+
+@pytest.mark.asyncio
+@pytest.mark.slow
+async def test_export_todos_should_stream_in_bounded_memory(
+    client, token, session, user
+):
+    await session.execute(
+        text(
+            'INSERT INTO todos (title, description, state, user_id) '
+            "SELECT 'Todo ' || n, repeat('x', 100), 'TODO', :user_id "
+            'FROM generate_series(1, :rows) AS n'
+        ),
+        {'user_id': user.id, 'rows': EXPORT_ROWS},
+    )
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': '/todos/export',
+        'raw_path': b'/todos/export',
+        'root_path': '',
+        'query_string': b'',
+        'headers': [(b'authorization', f'Bearer {token}'.encode())],
+        'client': ('testclient', 50000),
+        'server': ('testserver', 80),
+    }
+
+    tracemalloc.start()
+    try:
+        exported_bytes = await _drain(scope)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert exported_bytes > EXPORT_ROWS * 100
+    assert peak_bytes < exported_bytes / 10
+
+
+def test_import_todos_from_ndjson_should_report_row_errors(client, token):
+    body = '\n'.join([
+        json.dumps({'title': 'Imported 1', 'state': 'doing'}),
+        '',
+        json.dumps({'description': 'missing title'}),
+        'not json',
+        json.dumps({'title': 'Imported 2', 'description': 'second'}),
+    ])
+
+    response = client.post(
+        '/todos/import',
+        content=body,
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert (data['imported'], data['failed']) == (2, 2)
+    assert [error['line'] for error in data['errors']] == [3, 4]
+    assert data['errors'][0]['detail'] == 'title: Field required'
+
+    todos = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['todos']
+    assert [(todo['title'], todo['state']) for todo in todos] == [
+        ('Imported 1', 'doing'),
+        ('Imported 2', 'todo'),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_import_todos_should_report_rows_copy_rejects(
+    client, token, session
+):
+    # Stands in for any value the server refuses mid-COPY.
+    await session.execute(
+        text('ALTER TABLE todos ALTER COLUMN title TYPE varchar(20)')
+    )
+    body = '\n'.join([
+        json.dumps({'title': 'Imported 1'}),
+        json.dumps({'title': 'NUL \x00 byte'}),
+        json.dumps({'title': 'x' * 21}),
+        json.dumps({'title': 'Imported 2'}),
+    ])
+
+    response = client.post(
+        '/todos/import',
+        content=body,
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    data = response.json()
+    assert (data['imported'], data['failed']) == (2, 2)
+    assert [error['line'] for error in data['errors']] == [2, 3]
+    # NUL bytes are caught before COPY; the long title only by the server.
+    assert data['errors'][0]['detail'] == (
+        'title: NUL characters are not allowed'
+    )
+    assert 'too long' in data['errors'][1]['detail']
+
+    todos = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    ).json()['todos']
+    assert [todo['title'] for todo in todos] == ['Imported 1', 'Imported 2']
+
+
+def test_import_todos_from_csv_should_round_trip_export(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    body = (
+        'title,description,state\nFirst,"line one\nline two",done\nSecond,,\n'
+    )
+
+    response = client.post(
+        '/todos/import?format=csv', content=body, headers=headers
+    )
+
+    assert response.json() == {'imported': 2, 'failed': 0, 'errors': []}
+    exported = client.get('/todos/export?format=csv', headers=headers)
+    rows = list(csv.DictReader(io.StringIO(exported.text)))
+    assert [
+        (row['title'], row['description'], row['state']) for row in rows
+    ] == [('First', 'line one\nline two', 'done'), ('Second', '', 'todo')]
+
+
+def test_import_todos_from_csv_should_resume_after_malformed_rows(
+    client, token
+):
+    rows = [f'Valid {n},todo' for n in range(5)]
+    body = '\n'.join([
+        'title,state',
+        '"Unclosed quote,todo',
+        *rows[:3],
+        # Past the csv module's field size limit.
+        'x' * (csv.field_size_limit() + 1) + ',todo',
+        'x' * IMPORT_MAX_RECORD_CHARS + ',todo',
+        *rows[3:],
+    ])
+
+    response = client.post(
+        '/todos/import?format=csv',
+        content=body,
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    data = response.json()
+    assert (data['imported'], data['failed']) == (5, 3)
+    assert [error['line'] for error in data['errors']] == [2, 6, 7]
+    assert data['errors'][0]['detail'] == 'row: unclosed quote'
+    assert 'field larger than field limit' in data['errors'][1]['detail']
+    assert data['errors'][2]['detail'].startswith('row: longer than')
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_import_cli_should_copy_file_rows(
+    session, user, tmp_path, monkeypatch, capsys
+):
+    expected_todos = 3
+    monkeypatch.setenv(
+        'DATABASE_URL',
+        session.bind.url.render_as_string(hide_password=False),
+    )
+    path = tmp_path / 'todos.ndjson'
+    path.write_text(
+        '\n'.join(
+            json.dumps({'title': f'CLI {n}'}) for n in range(expected_todos)
+        )
+    )
+
+    await asyncio.to_thread(import_main, [str(path), '--user-id', '1'])
+
+    assert json.loads(capsys.readouterr().out)['imported'] == expected_todos
+    todos = await session.scalars(select(Todo).where(Todo.user_id == user.id))
+    assert [todo.title for todo in todos] == ['CLI 0', 'CLI 1', 'CLI 2']
+
+
 @pytest.mark.asyncio
 async def test_delete_todo(client, token, session, user):
     todo = TodoFactory(user_id=user.id)
@@ -208,6 +565,88 @@ async def test_update_todo(client, token, session, user):
     assert data['id'] == todo.id
 
 
+@pytest.mark.asyncio
+async def test_list_todos_with_matching_etag_should_return_304(
+    client, token, session, user, count_queries
+):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first = client.get('/todos/', headers=headers)
+    etag = first.headers['etag']
+
+    with count_queries(session.bind) as statements:
+        cached = client.get(
+            '/todos/', headers={**headers, 'If-None-Match': etag}
+        )
+
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert not cached.content
+    assert cached.headers['etag'] == etag
+    assert len(statements) == 1
+    assert 'todos.id' not in statements[0][0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    'route',
+    [
+        ('post', '/todos/', {'title': 'New todo'}),
+        ('patch', '/todos/{todo_id}', {'state': 'done'}),
+        ('delete', '/todos/{todo_id}', None),
+    ],
+)
+async def test_list_todos_etag_should_change_after_writes(
+    client, token, session, user, route
+):
+    method, url, payload = route
+    todo = TodoFactory(user_id=user.id)
+    session.add(todo)
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+    etag = client.get('/todos/', headers=headers).headers['etag']
+
+    client.request(
+        method, url.format(todo_id=todo.id), json=payload, headers=headers
+    )
+    response = client.get(
+        '/todos/', headers={**headers, 'If-None-Match': etag}
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers['etag'] != etag
+
+
+@pytest.mark.asyncio
+async def test_list_todos_fast_json_should_match_default_response(
+    client, token, session, user, monkeypatch
+):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = {'Authorization': f'Bearer {token}'}
+
+    default = client.get('/todos/?limit=2', headers=headers)
+    monkeypatch.setattr(responses.settings, 'FAST_JSON_RESPONSES', True)
+    fast = client.get('/todos/?limit=2', headers=headers)
+
+    assert fast.status_code == HTTPStatus.OK
+    assert fast.headers['content-type'] == 'application/json'
+    assert fast.json() == default.json()
+
+
+@pytest.mark.usefixtures('fast_json_responses')
+def test_create_todo_fast_json_should_keep_status_code(client, token):
+    response = client.post(
+        '/todos/',
+        json={'title': 'Fast path'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.CREATED
+    assert response.json()['state'] == 'todo'
+
+
 def test_update_nonexistent_todo(client, token):
     nonexistent_todo_id = 8888
 
@@ -226,3 +665,151 @@ def test_update_nonexistent_todo(client, token):
     assert response.status_code == HTTPStatus.NOT_FOUND
     data = response.json()
     assert data['detail'] == 'Task not found'
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+@pytest.mark.parametrize(
+    'route',
+    [
+        ('post', '/todos/', {'title': 'Single round trip'}, 'INSERT'),
+        ('patch', '/todos/1', {'state': 'done'}, 'UPDATE'),
+        ('delete', '/todos/1', None, 'DELETE'),
+    ],
+)
+async def test_todo_writes_should_run_a_single_query(
+    app_client, session, user, count_queries, route
+):
+    method, url, payload, verb = route
+    session.add(TodoFactory(user_id=user.id))
+    await session.commit()
+    headers = login_headers(app_client, user)
+    app_client.get('/todos/', headers=headers)
+
+    with count_queries(replica_router.primary) as statements:
+        response = app_client.request(
+            method, url, json=payload, headers=headers
+        )
+
+    assert response.is_success
+    # The statement_timeout for the request deadline, then the write.
+    assert [s.split()[0] for s, _ in statements] == ['SET', verb]
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+@pytest.mark.parametrize(
+    'route',
+    [
+        ('get', '/todos/', None, 4),
+        ('get', '/todos/?title=Title&rank=true', None, 4),
+        ('get', '/todos/export', None, 3),
+        ('post', '/todos/', {'title': 'Budget'}, 3),
+        ('patch', '/todos/1', {'state': 'done'}, 3),
+        ('delete', '/todos/1', None, 3),
+        ('post', '/todos/bulk', {'todos': [{'title': 'Budget'}] * 3}, 3),
+        ('patch', '/todos/bulk', {'ids': [1, 2], 'state': 'done'}, 3),
+        ('delete', '/todos/bulk', {'ids': [1, 2]}, 3),
+    ],
+)
+async def test_todo_routes_should_stay_within_query_budget(
+    app_client, session, user, assert_max_queries, route
+):
+    method, url, payload, max_queries = route
+    session.add_all(TodoFactory.create_batch(5, user_id=user.id))
+    await session.commit()
+    headers = login_headers(app_client, user)
+
+    with assert_max_queries(replica_router.primary, max_queries):
+        response = app_client.request(
+            method, url, json=payload, headers=headers
+        )
+
+    assert response.is_success
+
+
+def test_create_todos_bulk(client, token, count_queries, session):
+    payload = {
+        'todos': [
+            {'title': 'Bulk 1'},
+            {'title': 'Bulk 2', 'description': 'second', 'state': 'doing'},
+        ]
+    }
+
+    with count_queries(session.bind) as statements:
+        response = client.post(
+            '/todos/bulk',
+            json=payload,
+            headers={'Authorization': f'Bearer {token}'},
+        )
+
+    assert response.status_code == HTTPStatus.CREATED
+    data = response.json()
+    assert [todo['title'] for todo in data['todos']] == ['Bulk 1', 'Bulk 2']
+    assert data['todos'][1]['state'] == 'doing'
+    assert sum(s.startswith('INSERT') for s, _ in statements) == 1
+
+
+def test_create_todos_bulk_over_limit_should_return_422(client, token):
+    payload = {'todos': [{'title': f'Todo {n}'} for n in range(101)]}
+
+    response = client.post(
+        '/todos/bulk',
+        json=payload,
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.asyncio
+async def test_update_todos_state_bulk(
+    client, token, session, user, another_user
+):
+    own_todo = TodoFactory(user_id=user.id, state='todo')
+    other_todo = TodoFactory(user_id=another_user.id, state='todo')
+    session.add_all([own_todo, other_todo])
+    await session.commit()
+
+    response = client.patch(
+        '/todos/bulk',
+        json={'ids': [own_todo.id, other_todo.id, 9999], 'state': 'done'},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'results': [
+            {'id': own_todo.id, 'status': HTTPStatus.OK},
+            {'id': other_todo.id, 'status': HTTPStatus.NOT_FOUND},
+            {'id': 9999, 'status': HTTPStatus.NOT_FOUND},
+        ]
+    }
+    await session.refresh(own_todo)
+    await session.refresh(other_todo)
+    assert own_todo.state == 'done'
+    assert other_todo.state == 'todo'
+
+
+@pytest.mark.asyncio
+async def test_delete_todos_bulk(client, token, session, user):
+    todos = TodoFactory.create_batch(3, user_id=user.id)
+    session.add_all(todos)
+    await session.commit()
+    ids = [todo.id for todo in todos[:2]]
+
+    response = client.request(
+        'DELETE',
+        '/todos/bulk',
+        json={'ids': ids},
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {
+        'results': [{'id': id, 'status': HTTPStatus.OK} for id in ids]
+    }
+    remaining = client.get(
+        '/todos/', headers={'Authorization': f'Bearer {token}'}
+    ).json()
+    assert [todo['id'] for todo in remaining['todos']] == [todos[2].id]
@@ -1,8 +1,16 @@
+import asyncio
 from http import HTTPStatus
 
 import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from fastapi_async.app import app
+from fastapi_async.database import get_session, replica_router
+from fastapi_async.models import Todo, User
 from fastapi_async.schemas import UserOutSchema
+from tests.conftest import TodoFactory, login_headers
 
 
 @pytest.mark.asyncio
@@ -36,6 +44,80 @@ async def test_create_user_with_existing_email_should_return_409(client, user):
     assert response_data == 'User with this email or username already exists!'
 
 
+@pytest.mark.asyncio
+async def test_create_user_with_existing_username_should_return_409(
+    client, user
+):
+    payload = {
+        'username': user.username,
+        'email': 'brandnew@example.com',
+        'password': 'anotherpassword123',
+    }
+
+    response = client.post('/users/', json=payload)
+
+    assert response.status_code == HTTPStatus.CONFLICT
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_create_user_should_run_a_single_query(
+    app_client, count_queries
+):
+    payload = {
+        'username': 'onequery',
+        'email': 'onequery@example.com',
+        'password': 'securepassword123',
+    }
+
+    with count_queries(replica_router.primary) as statements:
+        response = app_client.post('/users/', json=payload)
+
+    assert response.status_code == HTTPStatus.CREATED
+    # The statement_timeout for the request deadline, then the upsert.
+    assert [statement.split()[0] for statement, _ in statements] == [
+        'SET',
+        'INSERT',
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_concurrent_signups_should_create_one_user(session):
+    signups = 10
+    payload = {
+        'username': 'racer',
+        'email': 'racer@example.com',
+        'password': 'securepassword123',
+    }
+
+    async def _session_per_request():
+        async with AsyncSession(
+            session.bind, expire_on_commit=False
+        ) as request_session:
+            yield request_session
+
+    app.dependency_overrides[get_session] = _session_per_request
+
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url='http://test'
+    ) as async_client:
+        responses = await asyncio.gather(
+            *(
+                async_client.post('/users/', json=payload)
+                for _ in range(signups)
+            )
+        )
+
+    app.dependency_overrides.clear()
+
+    statuses = sorted(response.status_code for response in responses)
+    assert statuses == [HTTPStatus.CREATED] + [HTTPStatus.CONFLICT] * (
+        signups - 1
+    )
+    assert await session.scalar(select(func.count()).select_from(User)) == 1
+
+
 @pytest.mark.asyncio
 async def test_list_users_should_return_all_users(client, user, token):
     user_schema = UserOutSchema.model_validate(user).model_dump()
@@ -49,6 +131,71 @@ async def test_list_users_should_return_all_users(client, user, token):
     assert response_data['users'] == [user_schema]
 
 
+@pytest.mark.asyncio
+@pytest.mark.usefixtures('fast_json_responses')
+async def test_list_users_fast_json_should_return_all_users(
+    client, user, token
+):
+    user_schema = UserOutSchema.model_validate(user).model_dump()
+
+    response = client.get(
+        '/users/',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.json() == {'users': [user_schema], 'next_cursor': None}
+
+
+@pytest.mark.asyncio
+async def test_list_users_etag_should_change_after_signup(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    etag = client.get('/users/', headers=headers).headers['etag']
+
+    cached = client.get('/users/', headers={**headers, 'If-None-Match': etag})
+    client.post(
+        '/users/',
+        json={
+            'username': 'newcomer',
+            'email': 'newcomer@email.com',
+            'password': 'newpassword',
+        },
+    )
+    changed = client.get('/users/', headers={**headers, 'If-None-Match': etag})
+
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+    assert changed.status_code == HTTPStatus.OK
+    assert changed.json()['users'][-1]['username'] == 'newcomer'
+
+
+@pytest.mark.asyncio
+async def test_list_users_etag_should_survive_todo_writes(client, token):
+    headers = {'Authorization': f'Bearer {token}'}
+    etag = client.get('/users/', headers=headers).headers['etag']
+
+    client.post('/todos/', json={'title': 'Unrelated'}, headers=headers)
+    cached = client.get('/users/', headers={**headers, 'If-None-Match': etag})
+
+    assert cached.status_code == HTTPStatus.NOT_MODIFIED
+
+
+@pytest.mark.asyncio
+async def test_list_users_with_cursor_should_return_next_page(
+    client, user, another_user, token
+):
+    headers = {'Authorization': f'Bearer {token}'}
+
+    first_page = client.get('/users/?limit=1', headers=headers).json()
+    second_page = client.get(
+        '/users/',
+        params={'limit': 1, 'cursor': first_page['next_cursor']},
+        headers=headers,
+    ).json()
+
+    assert [u['id'] for u in first_page['users']] == [user.id]
+    assert [u['id'] for u in second_page['users']] == [another_user.id]
+
+
 @pytest.mark.asyncio
 async def test_update_user_should_return_updated_user(client, user, token):
     payload = {
@@ -129,6 +276,25 @@ async def test_delete_user_should_return_no_content(client, user, token):
     assert response_data['message'] == 'User deleted successfully!'
 
 
+@pytest.mark.asyncio
+async def test_delete_user_should_delete_user_todos(
+    client, session, user, token
+):
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+
+    response = client.delete(
+        f'/users/{user.id}',
+        headers={'Authorization': f'Bearer {token}'},
+    )
+
+    assert response.status_code == HTTPStatus.OK
+    todos_count = await session.scalar(
+        select(func.count()).select_from(Todo).where(Todo.user_id == user.id)
+    )
+    assert todos_count == 0
+
+
 @pytest.mark.asyncio
 async def test_delete_other_user_should_return_403(
     client,
@@ -143,3 +309,64 @@ async def test_delete_other_user_should_return_403(
     assert response.status_code == HTTPStatus.FORBIDDEN
     response_data = response.json()['detail']
     assert response_data == 'You do not have permission to delete this user!'
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+@pytest.mark.parametrize(
+    'route',
+    [
+        ('get', '/users/', 4),
+        ('post', '/users/', 2),
+        ('put', '/users/{user_id}', 4),
+        ('delete', '/users/{user_id}', 3),
+    ],
+)
+async def test_user_routes_should_stay_within_query_budget(
+    app_client, session, user, assert_max_queries, route
+):
+    method, url, max_queries = route
+    session.add_all(TodoFactory.create_batch(3, user_id=user.id))
+    await session.commit()
+    headers = login_headers(app_client, user)
+
+    with assert_max_queries(replica_router.primary, max_queries):
+        response = app_client.request(
+            method,
+            url.format(user_id=user.id),
+            json={
+                'username': 'budget',
+                'email': 'budget@email.com',
+                'password': 'budgetpassword',
+            },
+            headers=headers,
+        )
+
+    assert response.is_success
+
+
+@pytest.mark.asyncio
+@pytest.mark.commits
+async def test_update_user_should_not_reload_user(
+    app_client, user, count_queries
+):
+    headers = login_headers(app_client, user)
+    app_client.get('/users/', headers=headers)
+
+    with count_queries(replica_router.primary) as statements:
+        response = app_client.put(
+            f'/users/{user.id}',
+            json={
+                'username': 'returninguser',
+                'email': 'returninguser@example.com',
+                'password': 'securepassword123',
+            },
+            headers=headers,
+        )
+
+    assert response.status_code == HTTPStatus.OK
+    assert [statement.split()[0] for statement, _ in statements] == [
+        'SET',
+        'SELECT',
+        'UPDATE',
+    ]